@@ -0,0 +1,128 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.db import connection
+from django.http import Http404
+from django.middleware.csrf import get_token
+from django.shortcuts import render
+
+from . import caching, db, views
+from .context_processors import popular_tags, best_members
+from .forms import AnswerForm
+from .models import Question, Answer, Tag, QuestionVote, AnswerVote
+from .page_cache import cache_page_for_anonymous
+
+# Async versions of the list views, served when the site runs under ASGI
+# (see askme/asgi.py). Independent queries of a page go to threads of
+# app.db pool with their own connections and run at the same time, while
+# the event loop keeps serving other clients.
+
+
+def start_request(request):
+    # Everything lazy about the request is resolved in the request thread:
+    # the session, the user and the CSRF cookie (ensure_csrf_cookie)
+    request.user.is_authenticated
+    get_token(request)
+    # Rows of an open transaction are not seen by other connections
+    return connection.in_atomic_block
+
+
+async def gather(sequential, *funcs):
+    if sequential:
+        return await sync_to_async(lambda: [func() for func in funcs])()
+    # Threads of the pool keep their connections between requests
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(*[
+        loop.run_in_executor(db.executor(), db.in_pool(func))
+        for func in funcs
+    ])
+
+
+def sidebar(context, tags, members):
+    context['popular_tags'] = tags
+    context['best_members'] = members
+    return context
+
+
+def set_page_count(context, count):
+    paginator = context['page_obj'].paginator
+    paginator.count = count
+    context['page_links']['approx_pages'] = paginator.num_pages
+    return context
+
+
+@cache_page_for_anonymous(lambda: [caching.PAGES_QUESTIONS])
+async def index(request):
+    # Index page
+    sequential = await sync_to_async(start_request)(request)
+
+    def page():
+        context = views.paginate_by_cursor(request, 5, Question.objects.new())
+        views.prepare_cards(request, context['page_obj'], QuestionVote, 'question')
+        return context
+
+    context, count, tags, members = await gather(
+        sequential, page, Question.objects.approximate_count, popular_tags, best_members
+    )
+    set_page_count(context, count)
+    sidebar(context, tags, members)
+    return await sync_to_async(render)(request, 'index.html', context)
+
+
+@cache_page_for_anonymous(lambda tag: [caching.tag_pages_name(tag)])
+async def tag_questions(request, tag):
+    # Page with question on one tag
+    sequential = await sync_to_async(start_request)(request)
+    # Questions are selected by id of the tag, it is found first
+    cur_tag = await sync_to_async(Tag.objects.find_by_name)(tag)
+    if not cur_tag:
+        raise Http404
+
+    def page():
+        context = views.paginate_by_cursor(
+            request, 5, Question.objects.find_by_tag(cur_tag),
+            count=cur_tag.usage_count,
+            unique_field=Question.objects.TAG_PAGE_KEY
+        )
+        views.prepare_cards(request, context['page_obj'], QuestionVote, 'question')
+        return context
+
+    context, tags, members = await gather(sequential, page, popular_tags, best_members)
+    if not context['page_obj']:
+        raise Http404
+    context['tag'] = f'{tag}'
+    sidebar(context, tags, members)
+    return await sync_to_async(render)(request, 'tag_questions.html', context)
+
+
+@cache_page_for_anonymous(lambda question_id: [caching.question_pages_name(question_id)])
+async def answers(request, question_id):
+    # Page with answers on current question, new answers go to the sync view
+    if request.method not in ('GET', 'HEAD'):
+        return await sync_to_async(views.answers)(request, question_id)
+    sequential = await sync_to_async(start_request)(request)
+
+    def question():
+        question = Question.objects.find_by_id(question_id)
+        views.attach_votes(request, [question], QuestionVote)
+        return question
+
+    def page():
+        context = views.paginate_by_cursor(
+            request, 5, Answer.objects.most_popular(question_id)
+        )
+        views.prepare_cards(request, context['page_obj'], AnswerVote, 'answer')
+        return context
+
+    def related():
+        return list(Question.objects.related_to(question_id))
+
+    question, context, related, tags, members = await gather(
+        sequential, question, page, related, popular_tags, best_members
+    )
+    set_page_count(context, question.answers_count)
+    context['question'] = question
+    context['related'] = related
+    context['form'] = AnswerForm()
+    sidebar(context, tags, members)
+    return await sync_to_async(render)(request, 'answers.html', context)
@@ -0,0 +1,119 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Names of versioned cache entries
+SIDEBAR_TAGS = 'sidebar:tags'
+SIDEBAR_BEST_MEMBERS = 'sidebar:best_members'
+PAGES_QUESTIONS = 'pages:questions'
+TAG_INDEX = 'tags:index'
+
+
+def get_cache():
+    return caches[settings.SIDEBAR_CACHE_ALIAS]
+
+
+def _version_key(name):
+    return f'{name}:version'
+
+
+def _new_version():
+    # Versions start from current time, so a lost version key never
+    # makes old entries reachable again
+    return int(time.time() * 1000)
+
+
+def get_version(name):
+    cache = get_cache()
+    version = cache.get(_version_key(name))
+    if version is None:
+        cache.add(_version_key(name), _new_version(), None)
+        version = cache.get(_version_key(name))
+    return version
+
+
+def get_versions(names):
+    # Versions of many entries with one cache round trip
+    cache = get_cache()
+    keys = {_version_key(name): name for name in names}
+    versions = cache.get_many(keys.keys())
+    missing = {key: _new_version() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def bump_version(name):
+    cache = get_cache()
+    try:
+        return cache.incr(_version_key(name))
+    except ValueError:
+        version = _new_version()
+        cache.set(_version_key(name), version, None)
+        return version
+
+
+def card_name(kind, pk):
+    return f'card:{kind}:{pk}'
+
+
+def profile_name(user_id):
+    return f'profile:{user_id}'
+
+
+def user_name(user_id):
+    return f'user:{user_id}'
+
+
+def question_pages_name(question_id):
+    return f'pages:question:{question_id}'
+
+
+def tag_pages_name(tag):
+    return f'pages:tag:{tag.lower()}'
+
+
+def invalidate_pages(question_ids=(), tags=()):
+    # New versions for cached pages of question lists, the questions
+    # and the tags. Keys of the old pages are never asked again
+    bump_version(PAGES_QUESTIONS)
+    for question_id in question_ids:
+        bump_version(question_pages_name(question_id))
+    for tag in tags:
+        bump_version(tag_pages_name(tag))
+
+
+def attach_card_versions(objects, kind):
+    # Sets card_version used as a part of the key of cached cards.
+    # It changes when the object or its author's profile is saved
+    objects = list(objects)
+    names = set()
+    for obj in objects:
+        names.add(card_name(kind, obj.pk))
+        names.add(profile_name(obj.author_id))
+    versions = get_versions(names)
+    for obj in objects:
+        obj.card_version = '{}-{}'.format(
+            versions[card_name(kind, obj.pk)],
+            versions[profile_name(obj.author_id)]
+        )
+    return objects
+
+
+def peek(name):
+    # Current value of the entry without building it
+    return get_cache().get(f'{name}:{get_version(name)}')
+
+
+def get_or_build(name, builder, timeout=None):
+    cache = get_cache()
+    key = f'{name}:{get_version(name)}'
+    value = cache.get(key)
+    if value is None:
+        value = builder()
+        if timeout is None:
+            timeout = settings.SIDEBAR_CACHE_TIMEOUT
+        cache.set(key, value, timeout)
+    return value
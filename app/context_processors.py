@@ -1,12 +1,29 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
 
+from . import caching
 from .models import Tag, Profile
 
 
-def all_tags_processor(request):
-    tags = Tag.objects.all()
-    return {'all_tags': tags}
+def popular_tags():
+    return caching.get_or_build(
+        caching.SIDEBAR_TAGS,
+        lambda: list(Tag.objects.popular(settings.SIDEBAR_TAGS_COUNT))
+    )
+
+
+def best_members():
+    return caching.get_or_build(
+        caching.SIDEBAR_BEST_MEMBERS,
+        lambda: list(Profile.objects.top_ten())
+    )
+
+
+# Lazy, so views which put the sidebar into the context themselves
+# do not load it twice
+def popular_tags_processor(request):
+    return {'popular_tags': SimpleLazyObject(popular_tags)}
 
 
 def best_members_processsor(request):
-    top_users = Profile.objects.top_ten()
-    return {'best_members': top_users}
+    return {'best_members': SimpleLazyObject(best_members)}
@@ -0,0 +1,79 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.signals import request_started, request_finished
+from django.db import connections, close_old_connections
+from django.dispatch import receiver
+
+from . import profiling
+
+# Connections are kept open for CONN_MAX_AGE seconds (see settings).
+# Django 3.1 reuses them without asking the server, so a connection
+# dropped by wait_timeout or a server restart fails the first query of
+# a request. Here an idle connection is pinged before it is reused.
+
+
+def check_connections(wrappers=None):
+    # Closes persistent connections which were idle for
+    # DB_HEALTH_CHECK_INTERVAL seconds and do not answer a ping,
+    # the next query opens a new one
+    now = time.monotonic()
+    for conn in wrappers or connections.all():
+        if conn.connection is None or conn.in_atomic_block:
+            continue
+        idle = now - getattr(conn, 'used_at', now)
+        if idle >= settings.DB_HEALTH_CHECK_INTERVAL and not conn.is_usable():
+            conn.close()
+
+
+def mark_used(wrappers=None):
+    now = time.monotonic()
+    for conn in wrappers or connections.all():
+        if conn.connection is not None:
+            conn.used_at = now
+
+
+@receiver(request_started)
+def check_on_request(sender, **kwargs):
+    check_connections()
+
+
+@receiver(request_finished)
+def mark_on_request(sender, **kwargs):
+    mark_used()
+
+
+# Threads running queries of async views at the same time. Every thread
+# keeps its own connection, so the pool is a pool of DB_POOL_SIZE
+# connections per worker process
+_executor = None
+_executor_pid = None
+
+
+def executor():
+    global _executor, _executor_pid
+    # A forked worker must not use threads of its parent
+    if _executor is None or _executor_pid != os.getpid():
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.DB_POOL_SIZE,
+            thread_name_prefix='db-pool'
+        )
+        _executor_pid = os.getpid()
+    return _executor
+
+
+def in_pool(func):
+    # func as a task of the pool, its connection is checked before
+    # and kept or closed after as for a request
+    func = profiling.track(func)
+
+    def run():
+        check_connections()
+        try:
+            return func()
+        finally:
+            mark_used()
+            close_old_connections()
+    return run
@@ -1,7 +1,9 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm, AuthenticationForm
+from django.urls import reverse
 
-from .models import Question, Answer, User, Profile
+from .models import Question, Answer, User, Profile, Tag
+from . import related, search, thumbnails
 
 import re
 from django.core.exceptions import ValidationError
@@ -12,12 +14,24 @@ class QuestionForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         self.request = kwargs.pop('request', None)
         super(QuestionForm, self).__init__(*args, **kwargs)
+        # Only chosen tags are rendered as options, others are found
+        # by autocomplete (static/js/tags.js)
+        tags = self.fields['tags']
+        if self.is_bound:
+            chosen = tags.widget.value_from_datadict(self.data, self.files, self.add_prefix('tags')) or []
+        else:
+            chosen = [getattr(tag, 'pk', tag) for tag in self.initial.get('tags') or []]
+        chosen = [pk for pk in chosen if str(pk).isdigit()]
+        tags.queryset = Tag.objects.filter(pk__in=chosen) if chosen else Tag.objects.none()
+        tags.widget.attrs['data-autocomplete'] = reverse('tag_autocomplete')
 
     def save(self):
         question = super(QuestionForm, self).save(commit=False)
         question.author = self.request.user
         question.save()
         question.tags.set(self.request.POST.getlist('tags'))
+        search.index_question(question)
+        related.index_question(question)
         return question
 
     def clean(self):
@@ -61,6 +75,7 @@ class AnswerForm(forms.ModelForm):
         answer.author = self.request.user
         answer.question = Question.objects.find_by_id(self.question_id)
         answer.save()
+        search.index_answer(answer)
         return answer
 
     def clean(self):
@@ -101,8 +116,9 @@ class RegistrationForm(UserCreationForm):
         user.refresh_from_db()
         user.profile.nickname = self.cleaned_data.get('nickname')
         if 'avatar' in self.FILES:
-            user.profile.avatar = self.FILES['avatar']
+            user.profile.set_avatar(self.FILES['avatar'])
         user.save()
+        thumbnails.schedule(user.profile)
         return user
 
     def clean(self):
@@ -144,8 +160,9 @@ class ProfileSettingsForm(forms.ModelForm):
         profile = super(ProfileSettingsForm, self).save(commit=False)
         profile.user = self.user
         if 'avatar' in self.FILES:
-            profile.avatar = self.FILES['avatar']
+            profile.set_avatar(self.FILES['avatar'])
         profile.save()
+        thumbnails.schedule(profile)
         return profile
 
     def clean(self):
@@ -0,0 +1,48 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+from app.models import Question, RelatedQuestion
+from app.related import build_links
+
+
+class Command(BaseCommand):
+    help = 'Rebuild related questions of all questions'
+
+    def index_batch(self, start, end):
+        tags = defaultdict(list)
+        rows = Question.tags.through.objects.filter(
+            question_id__gte=start,
+            question_id__lt=end
+        ).values_list('question_id', 'tag_id')
+        for question_id, tag_id in rows:
+            tags[question_id].append(tag_id)
+
+        with transaction.atomic():
+            RelatedQuestion.objects.filter(question_id__gte=start, question_id__lt=end).delete()
+            RelatedQuestion.objects.bulk_create([
+                link
+                for question_id, tag_ids in tags.items()
+                for link in build_links(question_id, tag_ids)
+            ], batch_size=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        bounds = Question.objects.aggregate(Min('pk'), Max('pk'))
+        if bounds['pk__min'] is None:
+            return
+
+        for start in range(bounds['pk__min'], bounds['pk__max'] + 1, batch_size):
+            self.index_batch(start, start + batch_size)
+            self.stdout.write(f'Indexed questions up to {start + batch_size - 1}')
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-b',
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of questions indexed in one transaction'
+        )
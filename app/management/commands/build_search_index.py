@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Min
+from app.models import Question, Answer, QuestionPosting
+from app.search import count_tokens, question_tokens
+
+
+class Command(BaseCommand):
+    help = 'Rebuild search index of questions and answers'
+
+    def index_batch(self, questions):
+        counters = {question.pk: question_tokens(question) for question in questions}
+        answers = Answer.objects.filter(
+            question_id__in=counters.keys()
+        ).values_list('question_id', 'text')
+        for question_id, text in answers:
+            counters[question_id].update(count_tokens(text))
+
+        with transaction.atomic():
+            QuestionPosting.objects.filter(question_id__in=counters.keys()).delete()
+            QuestionPosting.objects.bulk_create([
+                QuestionPosting(token=token, question_id=question_id, frequency=count)
+                for question_id, counter in counters.items()
+                for token, count in counter.items()
+            ], batch_size=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        bounds = Question.objects.aggregate(Min('pk'), Max('pk'))
+        if bounds['pk__min'] is None:
+            return
+
+        for start in range(bounds['pk__min'], bounds['pk__max'] + 1, batch_size):
+            questions = Question.objects.filter(
+                pk__gte=start,
+                pk__lt=start + batch_size
+            ).only('pk', 'title', 'text')
+            self.index_batch(questions)
+            self.stdout.write(f'Indexed questions up to {start + batch_size - 1}')
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-b',
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of questions indexed in one transaction'
+        )
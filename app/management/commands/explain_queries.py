@@ -0,0 +1,83 @@
+from django.core.management.base import BaseCommand
+from app.models import Question, Answer, Tag, Profile, User, QuestionVote
+from app.pagination import CursorPaginator
+
+
+class Command(BaseCommand):
+    help = 'Print EXPLAIN of the queries made by managers'
+
+    def get_queries(self):
+        tag = Tag.objects.order_by('-usage_count').first()
+        question = Question.objects.order_by('-answers_count').first()
+        user = User.objects.first()
+
+        queries = [
+            ('Question.objects.new()', Question.objects.new()[:5]),
+            ('Question.objects.most_popular()', Question.objects.most_popular()[:5]),
+            ('Profile.objects.top_ten()', Profile.objects.top_ten()),
+            ('Tag.objects.popular()', Tag.objects.popular()),
+        ]
+
+        new_pages = CursorPaginator(Question.objects.new(), 5)
+        last = Question.objects.new()[4:5].first()
+        if last is not None:
+            queries.append((
+                'Question.objects.new() keyset page',
+                new_pages.queryset.filter(
+                    new_pages.keyset_filter(new_pages.get_key(last))
+                )[:5]
+            ))
+
+        if tag is not None:
+            queries += [
+                ('Tag.objects.find_by_name()', Tag.objects.filter(normalized=tag.normalized)),
+                ('Question.objects.find_by_tag()', Question.objects.find_by_tag(tag)[:5]),
+            ]
+            tag_pages = CursorPaginator(
+                Question.objects.find_by_tag(tag), 5,
+                unique_field=Question.objects.TAG_PAGE_KEY
+            )
+            last = Question.objects.find_by_tag(tag)[4:5].first()
+            if last is not None:
+                queries.append((
+                    'Question.objects.find_by_tag() keyset page',
+                    tag_pages.queryset.filter(
+                        tag_pages.keyset_filter(tag_pages.get_key(last))
+                    )[:5]
+                ))
+        if question is not None:
+            queries.append(
+                ('Answer.objects.most_popular()', Answer.objects.most_popular(question)[:5])
+            )
+        if question is not None and user is not None:
+            queries.append((
+                'QuestionVote.objects.vote_of()',
+                QuestionVote.objects.filter(question=question, user=user)
+            ))
+        return queries
+
+    def handle(self, *args, **options):
+        explain_options = {}
+        if options['format']:
+            explain_options['format'] = options['format']
+        if options['analyze']:
+            explain_options['analyze'] = True
+
+        for name, queryset in self.get_queries():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain(**explain_options))
+            self.stdout.write('')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-f',
+            '--format',
+            type=str,
+            help='EXPLAIN output format supported by database, e.g. json'
+        )
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            help='Execute queries and show actual costs (PostgreSQL, MySQL 8.0.18+)'
+        )
@@ -0,0 +1,44 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.core.management.base import BaseCommand
+from app.models import Profile
+from app.thumbnails import make_thumbnail_by_id, make_thumbnail_in_pool
+
+
+class Command(BaseCommand):
+    help = 'Make avatar thumbnails for profiles which have none'
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.exclude(avatar='')
+        # With --all thumbnails are made again, e.g. after AVATAR_THUMBNAIL_SIZE changes
+        if not options['all']:
+            profiles = profiles.filter(avatar_thumbnail='')
+        profile_ids = list(profiles.values_list('pk', flat=True))
+
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                make = partial(make_thumbnail_in_pool, force=options['all'])
+                names = list(executor.map(make, profile_ids))
+        else:
+            make = partial(make_thumbnail_by_id, force=options['all'])
+            names = list(map(make, profile_ids))
+        done = len([name for name in names if name is not None])
+        self.stdout.write(self.style.SUCCESS(
+            f'Made {done} of {len(profile_ids)} thumbnails'
+        ))
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-a',
+            '--all',
+            action='store_true',
+            help='Replace existing thumbnails too'
+        )
+        parser.add_argument(
+            '-w',
+            '--workers',
+            type=int,
+            default=4,
+            help='Threads making thumbnails'
+        )
@@ -0,0 +1,68 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from app.db import check_connections
+
+
+class Command(BaseCommand):
+    help = 'Measure per-request database overhead with new and persistent connections'
+
+    def timed(self, conn, before=None):
+        # Milliseconds of a request doing one query
+        start = time.perf_counter()
+        if before is not None:
+            before()
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+        return (time.perf_counter() - start) * 1000
+
+    def new_connection(self, conn, count):
+        times = []
+        for i in range(count):
+            conn.close()
+            times.append(self.timed(conn))
+        return times
+
+    def persistent(self, conn, count, health_check):
+        conn.ensure_connection()
+        before = None
+        if health_check:
+            # Every reuse pings the server, the worst case of DB_HEALTH_CHECK_INTERVAL
+            conn.used_at = float('-inf')
+            before = lambda: check_connections([conn])
+        return [self.timed(conn, before) for i in range(count)]
+
+    def report(self, name, times):
+        times = sorted(times)
+        self.stdout.write('{:<28} mean {:8.3f} ms  p50 {:8.3f} ms  p95 {:8.3f} ms'.format(
+            name,
+            statistics.mean(times),
+            times[len(times) // 2],
+            times[int(len(times) * 0.95)],
+        ))
+
+    def handle(self, *args, **options):
+        conn = connections[options['database']]
+        count = options['requests']
+        self.stdout.write(f"{conn.vendor}, {count} requests")
+        self.report('new connection', self.new_connection(conn, count))
+        self.report('persistent', self.persistent(conn, count, False))
+        self.report('persistent + health check', self.persistent(conn, count, True))
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-n',
+            '--requests',
+            type=int,
+            default=200,
+            help='Queries measured in every mode'
+        )
+        parser.add_argument(
+            '--database',
+            default='default',
+            help='Database alias'
+        )
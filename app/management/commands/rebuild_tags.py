@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from app import caching
+from app.models import Tag
+
+
+class Command(BaseCommand):
+    help = 'Fill normalized tag names and recount tag usage'
+
+    def handle(self, *args, **options):
+        # Lookups by name need normalized, run once after the column is added
+        self.stdout.write('Normalizing tag names')
+        Tag.objects.normalize_names()
+        # "Popular Tags" are ordered by usage_count
+        self.stdout.write('Recounting tag usage')
+        Tag.objects.recount_usage()
+        caching.bump_version(caching.SIDEBAR_TAGS)
+        caching.bump_version(caching.TAG_INDEX)
+        self.stdout.write(self.style.SUCCESS('Done'))
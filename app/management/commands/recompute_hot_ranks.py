@@ -0,0 +1,62 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from app import caching
+from app.models import CommandRun, Question, hot_rank
+
+# Questions touched after the start of the last run need a new rank
+RUN_NAME = 'recompute_hot_ranks'
+
+
+class Command(BaseCommand):
+    help = 'Recompute hot rank of questions touched since the last run'
+
+    def recompute(self, questions, batch_size):
+        # Keyset batches over the touched_at index range, cost follows
+        # the number of touched questions, not the table size
+        last_id = 0
+        updated = 0
+        while True:
+            rows = list(
+                questions.filter(pk__gt=last_id).order_by('pk').values_list(
+                    'pk', 'score', 'answers_count', 'date_create'
+                )[:batch_size]
+            )
+            if not rows:
+                return updated
+            Question.objects.bulk_update([
+                Question(pk=pk, hot_rank=hot_rank(score, answers_count, date_create))
+                for pk, score, answers_count, date_create in rows
+            ], ['hot_rank'])
+            updated += len(rows)
+            last_id = rows[-1][0]
+
+    def handle(self, *args, **options):
+        started = timezone.now()
+        since = None if options['all'] else CommandRun.objects.last_started(RUN_NAME)
+
+        questions = Question.objects.all()
+        if since is not None:
+            questions = questions.filter(touched_at__gte=since)
+        updated = self.recompute(questions, options['batch_size'])
+
+        CommandRun.objects.finish(RUN_NAME, started)
+        # Reaches web workers with a shared cache backend, with local
+        # memory caches pages expire after PAGE_CACHE_TIMEOUT
+        if updated:
+            caching.bump_version(caching.PAGES_QUESTIONS)
+        self.stdout.write(self.style.SUCCESS(f'Recomputed {updated} questions'))
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-a',
+            '--all',
+            action='store_true',
+            help='Recompute every question, e.g. after HOT_* settings change'
+        )
+        parser.add_argument(
+            '-b',
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Questions updated by one statement'
+        )
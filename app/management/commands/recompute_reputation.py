@@ -0,0 +1,104 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, Max, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from app.models import Question, Answer, Profile, QuestionVote, AnswerVote
+
+
+def sum_subquery(queryset, group_field, sum_field):
+    return Coalesce(
+        Subquery(
+            queryset.order_by().values(group_field).annotate(
+                total=Sum(sum_field)
+            ).values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def count_subquery(queryset, group_field):
+    return Coalesce(
+        Subquery(
+            queryset.order_by().values(group_field).annotate(
+                total=Count('pk')
+            ).values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+class Command(BaseCommand):
+    help = 'Rebuild denormalized scores and reputation from votes'
+
+    def batches(self, model, batch_size):
+        bounds = model.objects.aggregate(Min('pk'), Max('pk'))
+        if bounds['pk__min'] is None:
+            return
+        for start in range(bounds['pk__min'], bounds['pk__max'] + 1, batch_size):
+            yield model.objects.filter(pk__gte=start, pk__lt=start + batch_size)
+
+    def recompute_questions(self, batch_size):
+        for batch in self.batches(Question, batch_size):
+            with transaction.atomic():
+                batch.update(
+                    score=sum_subquery(
+                        QuestionVote.objects.filter(question=OuterRef('pk')),
+                        'question', 'vote'
+                    ),
+                    answers_count=count_subquery(
+                        Answer.objects.filter(question=OuterRef('pk')),
+                        'question'
+                    )
+                )
+
+    def recompute_answers(self, batch_size):
+        for batch in self.batches(Answer, batch_size):
+            with transaction.atomic():
+                batch.update(
+                    score=sum_subquery(
+                        AnswerVote.objects.filter(answer=OuterRef('pk')),
+                        'answer', 'vote'
+                    )
+                )
+
+    def recompute_profiles(self, batch_size):
+        for batch in self.batches(Profile, batch_size):
+            with transaction.atomic():
+                batch.update(
+                    score=sum_subquery(
+                        Question.objects.filter(author=OuterRef('user')),
+                        'author', 'score'
+                    ) + sum_subquery(
+                        Answer.objects.filter(author=OuterRef('user')),
+                        'author', 'score'
+                    )
+                )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        if options['posts']:
+            self.stdout.write('Recomputing question scores and answer counts')
+            self.recompute_questions(batch_size)
+            self.stdout.write('Recomputing answer scores')
+            self.recompute_answers(batch_size)
+
+        self.stdout.write('Recomputing profile reputation')
+        self.recompute_profiles(batch_size)
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-b',
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of rows updated by one statement'
+        )
+        parser.add_argument(
+            '--posts',
+            action='store_true',
+            help='Also recount question and answer scores from votes'
+        )
@@ -1,6 +1,13 @@
+import os
+from multiprocessing import Pool
+from random import choice, sample, randint, seed as random_seed
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
 from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from app import caching
 from app.models import Question, Answer, Tag, User, QuestionVote, AnswerVote, Profile
-from random import choice, sample, randint
 from faker import Faker
 
 quantity_values = {
@@ -8,41 +15,130 @@ quantity_values = {
         'questions': 10,
         'answers': 20,
         'tags': 5,
-        'users': 5
+        'users': 5,
+        'votes': 50
     },
     'medium': {
         'questions': 100,
         'answers': 200,
         'tags': 50,
-        'users': 50
+        'users': 50,
+        'votes': 500
     },
     'large': {
         'questions': 1000,
         'answers': 2000,
         'tags': 500,
-        'users': 500
+        'users': 500,
+        'votes': 5000
+    },
+    'huge': {
+        'questions': 1000000,
+        'answers': 2000000,
+        'tags': 10000,
+        'users': 100000,
+        'votes': 5000000
     }
 }
 
 fake = Faker()
 
 
+# ================= DATA GENERATORS =================
+# Run in worker processes when --workers > 1, so they only
+# produce plain values and never touch the database
+
+def init_worker(seed):
+    worker_seed = seed + os.getpid()
+    fake.seed_instance(worker_seed)
+    random_seed(worker_seed)
+
+
+def generate_users(chunk):
+    start, count = chunk
+    return [
+        (f'{fake.user_name()}_{start + i}', fake.email())
+        for i in range(count)
+    ]
+
+
+def generate_tags(chunk):
+    start, count = chunk
+    return [f'{fake.word()}-{start + i}' for i in range(count)]
+
+
+def generate_questions(chunk):
+    start, count = chunk
+    return [
+        (
+            fake.sentence()[:128],
+            '. '.join(fake.sentences(randint(2, 5)))
+        )
+        for i in range(count)
+    ]
+
+
+def generate_answers(chunk):
+    start, count = chunk
+    return ['. '.join(fake.sentences(randint(2, 5))) for i in range(count)]
+
+
 class Command(BaseCommand):
     help = 'Seed fake data into database'
 
+    def generate(self, generator, count, offset=0):
+        # Yields generated rows by chunks of batch size,
+        # offset + row number is used to make unique names
+        chunks = [
+            (offset + start, min(self.batch_size, count - start))
+            for start in range(0, count, self.batch_size)
+        ]
+        if self.pool is not None:
+            return self.pool.imap(generator, chunks)
+        return map(generator, chunks)
+
+    def new_ids(self, model, last_id):
+        # bulk_create does not return ids on MySQL
+        return list(
+            model.objects.filter(pk__gt=last_id).order_by('pk').values_list(
+                'id', flat=True
+            )
+        )
+
+    def last_id(self, model):
+        return model.objects.aggregate(Max('pk'))['pk__max'] or 0
+
     def fill_users(self, count):
-        for i in range(count):
-            profile = fake.simple_profile()
-            u = User.objects.create(
-                is_superuser=False,
-                username=profile['username'],
-                email=profile['mail']
+        # One hash for everybody, PBKDF2 per user is the slowest part
+        password = make_password('password')
+        offset = self.last_id(User)
+
+        for rows in self.generate(generate_users, count, offset):
+            last_id = self.last_id(User)
+            User.objects.bulk_create([
+                User(
+                    is_superuser=False,
+                    username=username,
+                    email=email,
+                    password=password
+                )
+                for username, email in rows
+            ], ignore_conflicts=True)
+            # post_save is not sent by bulk_create, profiles are made here
+            Profile.objects.bulk_create([
+                Profile(user_id=pk, nickname=username)
+                for pk, username in User.objects.filter(
+                    pk__gt=last_id
+                ).values_list('id', 'username')
+            ])
+
+    def fill_tags(self, count):
+        offset = self.last_id(Tag)
+        for rows in self.generate(generate_tags, count, offset):
+            Tag.objects.bulk_create(
+                [Tag(tag=tag, normalized=tag.lower()) for tag in rows],
+                ignore_conflicts=True
             )
-            u.set_password('password')
-            u.save(update_fields=['password'])
-            new_profile = Profile.objects.get(pk=u.pk)
-            new_profile.nickname = profile['username']
-            new_profile.save(update_fields=['nickname'])
 
     def fill_questions(self, count):
         author_ids = list(
@@ -55,14 +151,27 @@ class Command(BaseCommand):
                 'id', flat=True
             )
         )
+        if not author_ids:
+            raise CommandError('Questions need users, seed them first')
+        through = Question.tags.through
 
-        for i in range(count):
-            q = Question.objects.create(
-                author_id=choice(author_ids),
-                text='. '.join(fake.sentences(fake.random_int(min=2, max=5))),
-                title=fake.sentence()[:128]
-            )
-            q.tags.set(sample(tags_ids, k=randint(1, 5)))
+        for rows in self.generate(generate_questions, count):
+            last_id = self.last_id(Question)
+            Question.objects.bulk_create([
+                Question(
+                    author_id=choice(author_ids),
+                    title=title,
+                    text=text
+                )
+                for title, text in rows
+            ])
+            if not tags_ids:
+                continue
+            through.objects.bulk_create([
+                through(question_id=q_id, tag_id=tag_id)
+                for q_id in self.new_ids(Question, last_id)
+                for tag_id in sample(tags_ids, k=randint(1, min(5, len(tags_ids))))
+            ])
 
     def fill_answers(self, count):
         author_ids = list(
@@ -75,36 +184,105 @@ class Command(BaseCommand):
                 'id', flat=True
             )
         )
+        if not author_ids or not q_ids:
+            raise CommandError('Answers need users and questions, seed them first')
 
-        for i in range(count):
-            Answer.objects.create(
-                author_id=choice(author_ids),
-                question_id=choice(q_ids),
-                text='. '.join(fake.sentences(randint(2, 5)))
-            )
+        for rows in self.generate(generate_answers, count):
+            Answer.objects.bulk_create([
+                Answer(
+                    author_id=choice(author_ids),
+                    question_id=choice(q_ids),
+                    text=text
+                )
+                for text in rows
+            ])
 
-    def fill_tags(self, count):
-        for i in range(count):
-            Tag.objects.create(
-                tag=fake.word()
+    def fill_votes(self, model, target_field, count):
+        user_ids = list(User.objects.values_list('id', flat=True))
+        target_ids = list(
+            model._meta.get_field(target_field).related_model.objects.values_list(
+                'id', flat=True
             )
+        )
+        if not user_ids or not target_ids:
+            return
+        votes = [model.LIKE, model.DISLIKE]
+
+        for start in range(0, count, self.batch_size):
+            # Repeated (user, target) pairs are skipped by unique constraint
+            model.objects.bulk_create([
+                model(**{
+                    f'{target_field}_id': choice(target_ids),
+                    'user_id': choice(user_ids),
+                    'vote': choice(votes),
+                })
+                for i in range(min(self.batch_size, count - start))
+            ], ignore_conflicts=True)
+
+    def recompute_counters(self):
+        # Signals and vote deltas are skipped by bulk_create
+        call_command('rebuild_tags', stdout=self.stdout)
+        call_command(
+            'recompute_reputation',
+            posts=True,
+            batch_size=self.batch_size,
+            stdout=self.stdout
+        )
+        call_command('recompute_hot_ranks', all=True, stdout=self.stdout)
+        caching.bump_version(caching.SIDEBAR_TAGS)
+        caching.bump_version(caching.SIDEBAR_BEST_MEMBERS)
+        caching.get_cache().delete(Question.objects.COUNT_CACHE_KEY)
+
+    def build_indexes(self):
+        # Seeded posts skip QuestionForm and AnswerForm which keep them
+        call_command('build_search_index', stdout=self.stdout)
+        call_command('build_related_index', stdout=self.stdout)
 
     def handle(self, *args, **options):
-        print(options['size'])
-        quantity = quantity_values[options['size']]
+        self.stdout.write(options['size'])
+        quantity = dict(quantity_values[options['size']])
+        for name in quantity:
+            if options[name] is not None:
+                quantity[name] = options[name]
+
+        self.batch_size = options['batch_size']
+        self.pool = None
+        if options['workers'] > 1:
+            self.pool = Pool(
+                options['workers'],
+                initializer=init_worker,
+                initargs=(randint(0, 2 ** 31),)
+            )
+
+        try:
+            # ================= USERS =================
+            self.stdout.write(f"Users: {quantity['users']}")
+            self.fill_users(quantity['users'])
 
-        # ================= USERS =================
-        self.fill_users(quantity['users'])
+            # ================= TAGS =================
+            self.stdout.write(f"Tags: {quantity['tags']}")
+            self.fill_tags(quantity['tags'])
 
-        # ================= TAGS =================
-        self.fill_tags(quantity['tags'])
+            # ================= QUESTIONS =================
+            self.stdout.write(f"Questions: {quantity['questions']}")
+            self.fill_questions(quantity['questions'])
 
-        # ================= QUESTIONS =================
-        self.fill_questions(quantity['questions'])
+            # ================= ANSWERS =================
+            self.stdout.write(f"Answers: {quantity['answers']}")
+            self.fill_answers(quantity['answers'])
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
 
-        # ================= ANSWERS =================
-        self.fill_answers(quantity['answers'])
+        # ================= VOTES =================
+        self.stdout.write(f"Votes: {quantity['votes']}")
+        question_votes = quantity['votes'] // 2
+        self.fill_votes(QuestionVote, 'question', question_votes)
+        self.fill_votes(AnswerVote, 'answer', quantity['votes'] - question_votes)
 
+        self.recompute_counters()
+        self.build_indexes()
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -113,10 +291,26 @@ class Command(BaseCommand):
             nargs='?',
             type=str,
             action='store',
-            choices=[
-                'small',
-                'medium',
-                'large',
-            ],
+            choices=list(quantity_values),
             default='small'
         )
+        for name in ('users', 'tags', 'questions', 'answers', 'votes'):
+            parser.add_argument(
+                f'--{name}',
+                type=int,
+                help=f'Number of {name}, overrides the size preset'
+            )
+        parser.add_argument(
+            '-b',
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows inserted by one statement'
+        )
+        parser.add_argument(
+            '-w',
+            '--workers',
+            type=int,
+            default=1,
+            help='Processes generating fake data'
+        )
@@ -1,48 +1,244 @@
+import datetime
+import math
+from collections import defaultdict
+
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.core.exceptions import ObjectDoesNotExist
 from django.http import Http404
-from django.db.models import Sum
+from django.db.models import Sum, F, Count, OuterRef, Subquery, IntegerField
+from django.db.models.functions import Coalesce, Lower
+from django.db.models.signals import post_delete, pre_delete, m2m_changed
+from django.db import transaction, connections, IntegrityError
+from django.utils import timezone
+
+from . import caching
+
+
+HOT_EPOCH = datetime.date(2020, 1, 1)
+
+
+def hot_rank(score, answers_count, date_create):
+    # Order of magnitude of the activity plus the age term: a question
+    # needs 10 times more activity than one HOT_DECAY_SECONDS younger.
+    # The age term does not change with time, so only questions with
+    # new votes or answers need a new rank
+    activity = score + settings.HOT_ANSWER_WEIGHT * answers_count
+    order = math.log10(max(abs(activity), 1))
+    sign = (activity > 0) - (activity < 0)
+    age = (date_create - HOT_EPOCH).days * 24 * 60 * 60
+    return sign * order + age / settings.HOT_DECAY_SECONDS
+
+
+def group_by_value(mapping):
+    # {key: value} -> {value: [keys]}, zero values are dropped
+    groups = defaultdict(list)
+    for key, value in mapping.items():
+        if value:
+            groups[value].append(key)
+    return groups
 
 
 # =============================== NEW VOTES STRATS ===============================
 class VoteInterface():
+    # Vote models may define get_target_changes(): other fields of the
+    # voted object updated with its score by VoteManager.apply_deltas()
+
     def like(self):
-        if self.vote == self.LIKE:
-            self.vote = self.UNVOTED
-        else:
-            self.vote = self.LIKE
-        self.save(update_fields=['vote'])
-        return True
+        return self.switch(self.LIKE)
 
     def dislike(self):
-        if self.vote == self.DISLIKE:
-            self.vote = self.UNVOTED
-        else:
-            self.vote = self.DISLIKE
-        self.save(update_fields=['vote'])
+        return self.switch(self.DISLIKE)
+
+    def switch(self, vote):
+        # Same vote twice cancels it. Written by objects.record(), which
+        # also shifts the scores
+        manager = type(self).objects
+        self.vote = self.UNVOTED if self.vote == vote else vote
+        target_id = getattr(self, f'{manager.target_field}_id')
+        manager.record(target_id, self.user_id, self.vote)
         return True
 
+    def get_target_changes(self):
+        return {}
 
-class QuestionVoteManager(models.Manager):
-    def find_or_create(self, question, user):
-        try:
-            vote = self.get(question=question, user=user)
-        except ObjectDoesNotExist as identifier:
-            vote = self.create(question=question, user=user)
-        return vote
 
+class VoteManager(models.Manager):
+    # Name of the foreign key to voted object, set in subclasses
+    target_field = None
 
-class AnswerVoteManager(models.Manager):
-    def find_or_create(self, answer, user):
-        try:
-            vote = self.get(answer=answer, user=user)
-        except ObjectDoesNotExist as identifier:
-            vote = self.create(answer=answer, user=user)
+    def find_or_create(self, target, user):
+        # get_or_create() retries get() when a parallel request
+        # has inserted the same vote first
+        vote, created = self.get_or_create(**{
+            self.target_field: target,
+            'user': user,
+        })
         return vote
 
+    def apply_deltas(self, deltas):
+        # {target id: score delta} of many votes at once: targets and
+        # authors with the same total change share one UPDATE
+        deltas = {target_id: delta for target_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        target_model = self.model._meta.get_field(self.target_field).related_model
+        authors = defaultdict(int)
+        for target_id, author_id in target_model.objects.filter(
+            pk__in=deltas.keys()
+        ).values_list('pk', 'author_id'):
+            authors[author_id] += deltas[target_id]
+
+        changes = self.model().get_target_changes()
+        for delta, target_ids in group_by_value(deltas).items():
+            target_model.objects.filter(pk__in=target_ids).update(
+                score=F('score') + delta, **changes
+            )
+        # Reputation of the author follows the score of the post
+        for delta, author_ids in group_by_value(authors).items():
+            Profile.objects.filter(user__in=author_ids).update(score=F('score') + delta)
+        Profile.objects.invalidate_top_ten(Profile.objects.filter(user__in=authors.keys()))
+
+    def votes_of(self, user, target_ids, pending=None):
+        # {target id: vote} of the user with one IN query.
+        # pending maps target id to not yet written vote of the user
+        if not target_ids or not user.is_authenticated:
+            return {}
+        votes = dict(self.filter(**{
+            f'{self.target_field}_id__in': target_ids,
+            'user': user,
+        }).values_list(f'{self.target_field}_id', 'vote'))
+        if pending:
+            votes.update(
+                (target_id, vote) for target_id, vote in pending.items()
+                if target_id in target_ids
+            )
+        return votes
+
+    def vote_of(self, user, target):
+        return self.votes_of(user, [target.pk]).get(target.pk, self.model.UNVOTED)
+
+    def attach_to(self, objects, user, pending=None):
+        # Sets user_vote on every question/answer in objects
+        objects = list(objects)
+        votes = self.votes_of(user, [obj.pk for obj in objects], pending)
+        for obj in objects:
+            obj.user_vote = votes.get(obj.pk, self.model.UNVOTED)
+        return objects
+
+    def record(self, target, user, vote):
+        # Sets the vote of the user and shifts scores by the difference.
+        # Returns the previous vote
+        key = (getattr(target, 'pk', target), getattr(user, 'pk', user))
+        return self.record_many({key: vote})[key]
+
+    def record_many(self, votes):
+        # {(target id, user id): vote}. Every vote is written by upsert()
+        # which gives the previous one, no row is read before, and score
+        # changes are applied summed per target. Returns previous votes
+        previous = {}
+        deltas = defaultdict(int)
+        with transaction.atomic(using=self.db):
+            # Same order of row locks in every transaction
+            for (target_id, user_id), vote in sorted(votes.items()):
+                previous[target_id, user_id] = self.upsert(target_id, user_id, vote)
+                deltas[target_id] += vote - previous[target_id, user_id]
+            self.apply_deltas(deltas)
+        return previous
+
+    def upsert(self, target_id, user_id, vote):
+        # Writes the vote and returns the previous one (UNVOTED if there
+        # was no row): one statement on PostgreSQL, one write and a read of
+        # a session variable on MySQL, which has no RETURNING, and a
+        # locking read and a write elsewhere
+        connection = connections[self.db]
+        if connection.vendor == 'mysql':
+            return self.upsert_mysql(connection, target_id, user_id, vote)
+        if connection.vendor == 'postgresql':
+            return self.upsert_postgresql(connection, target_id, user_id, vote)
+        return self.upsert_generic(target_id, user_id, vote)
+
+    def get_columns(self, connection):
+        opts = self.model._meta
+        quote = connection.ops.quote_name
+        return (
+            quote(opts.db_table),
+            quote(opts.get_field('user').column),
+            quote(opts.get_field(self.target_field).column),
+            quote(opts.get_field('vote').column),
+        )
+
+    def upsert_mysql(self, connection, target_id, user_id, vote):
+        table, user, target, vote_column = self.get_columns(connection)
+        with connection.cursor() as cursor:
+            # Old value is saved to a session variable by ON DUPLICATE KEY UPDATE,
+            # the row stays locked until the transaction ends
+            cursor.execute(
+                f'INSERT INTO {table} ({user}, {target}, {vote_column}) '
+                f'SELECT %s, %s, %s FROM (SELECT @previous_vote := NULL) AS init '
+                f'ON DUPLICATE KEY UPDATE {vote_column} = IF('
+                f'(@previous_vote := {table}.{vote_column}) IS NULL, '
+                f'VALUES({vote_column}), VALUES({vote_column}))',
+                [user_id, target_id, vote]
+            )
+            cursor.execute('SELECT @previous_vote')
+            previous = cursor.fetchone()[0]
+        return self.model.UNVOTED if previous is None else int(previous)
+
+    def upsert_postgresql(self, connection, target_id, user_id, vote):
+        # The row is locked and updated if it exists, inserted otherwise.
+        # When a parallel transaction inserts it first, nothing is written
+        # (ON CONFLICT DO NOTHING) and the statement is repeated: its
+        # snapshot now has the row, so the previous vote is never lost
+        table, user, target, vote_column = self.get_columns(connection)
+        where = f'{user} = %s AND {target} = %s'
+        with connection.cursor() as cursor:
+            while True:
+                cursor.execute(
+                    f'WITH previous AS ('
+                    f'SELECT {vote_column} FROM {table} WHERE {where} FOR UPDATE'
+                    f'), updated AS ('
+                    f'UPDATE {table} SET {vote_column} = %s '
+                    f'WHERE {where} AND EXISTS (SELECT 1 FROM previous)'
+                    f'), inserted AS ('
+                    f'INSERT INTO {table} ({user}, {target}, {vote_column}) '
+                    f'SELECT %s, %s, %s WHERE NOT EXISTS (SELECT 1 FROM previous) '
+                    f'ON CONFLICT ({user}, {target}) DO NOTHING RETURNING 1'
+                    f') SELECT (SELECT {vote_column} FROM previous), '
+                    f'(SELECT count(*) FROM inserted)',
+                    [user_id, target_id, vote, user_id, target_id, user_id, target_id, vote]
+                )
+                previous, inserted = cursor.fetchone()
+                if previous is not None:
+                    return previous
+                if inserted:
+                    return self.model.UNVOTED
+
+    def upsert_generic(self, target_id, user_id, vote):
+        lookup = {f'{self.target_field}_id': target_id, 'user_id': user_id}
+        votes = self.select_for_update().filter(**lookup)
+        previous = votes.values_list('vote', flat=True).first()
+        if previous is None:
+            try:
+                with transaction.atomic(using=self.db):
+                    self.create(vote=vote, **lookup)
+                return self.model.UNVOTED
+            except IntegrityError:
+                previous = votes.values_list('vote', flat=True).get()
+        votes.update(vote=vote)
+        return previous
+
+
+class QuestionVoteManager(VoteManager):
+    target_field = 'question'
+
+
+class AnswerVoteManager(VoteManager):
+    target_field = 'answer'
+
 
 class QuestionVote(models.Model, VoteInterface):
     LIKE = 1
@@ -76,6 +272,10 @@ class QuestionVote(models.Model, VoteInterface):
     def __str__(self):
         return f'{self.question.title} Vote: {self.vote}'
 
+    def get_target_changes(self):
+        # Hot rank of the question is recomputed by recompute_hot_ranks
+        return {'touched_at': timezone.now()}
+
     class Meta():
         unique_together = [
             'user',
@@ -127,22 +327,54 @@ class AnswerVote(models.Model, VoteInterface):
 # =============================== MANAGERS STARTS ===============================
 
 class QuestionManager(models.Manager):
+    COUNT_CACHE_KEY = 'questions:count'
+    COUNT_CACHE_TIMEOUT = 60
+    # Annotation which orders pages of find_by_tag()
+    TAG_PAGE_KEY = 'tag_question'
+
+    def list_plan(self, queryset):
+        # Everything a question card needs: author with profile
+        # in the same query and all tags of the page in one more
+        return queryset.select_related('author__profile').prefetch_related('tags')
+
     def most_popular(self):
-        return self.all().order_by('-score').prefetch_related('author', 'tags')
+        return self.list_plan(self.all().order_by('-score', '-id'))
+
+    def hot(self):
+        return self.list_plan(self.all().order_by('-hot_rank', '-id'))
+
+    def related_to(self, question_id):
+        # Titles of related questions with one join of RelatedQuestion
+        return self.filter(back_links__question_id=question_id).order_by(
+            '-back_links__weight', '-back_links__related'
+        ).only('id', 'title')[:settings.RELATED_QUESTIONS_COUNT]
 
     def new(self):
-        return self.all().order_by('-date_create').prefetch_related('author', 'tags')
+        return self.list_plan(self.all().order_by('-date_create', '-id'))
+
+    def approximate_count(self):
+        # COUNT(*) over the whole table is refreshed once a minute
+        cache = caching.get_cache()
+        count = cache.get(self.COUNT_CACHE_KEY)
+        if count is None:
+            count = self.count()
+            cache.set(self.COUNT_CACHE_KEY, count, self.COUNT_CACHE_TIMEOUT)
+        return count
 
     def find_by_tag(self, tag):
-        questions = self.filter(
-            tags__tag__iexact=tag).prefetch_related('author')
-        if not questions:
-            raise Http404
-        return questions
+        # Questions of a Tag found by the caller, newest (highest id) first.
+        # Rows are read and ordered by the (tag, -question) index of the
+        # through table. TAG_PAGE_KEY is its question_id, unique within
+        # the tag, so keyset pages need no id tiebreaker
+        return self.list_plan(
+            self.filter(tag_links__tag=tag)
+            .annotate(**{self.TAG_PAGE_KEY: F('tag_links__question')})
+            .order_by(f'-{self.TAG_PAGE_KEY}')
+        )
 
     def find_by_id(self, id):
         try:
-            question = self.get(pk=id)
+            question = self.select_related('author__profile').get(pk=id)
         except ObjectDoesNotExist:
             raise Http404
         return question
@@ -150,7 +382,9 @@ class QuestionManager(models.Manager):
 
 class AnswerManager(models.Manager):
     def most_popular(self, question):
-        return self.filter(question=question).order_by('-is_correct', '-score')
+        return self.filter(question=question).order_by(
+            '-is_correct', '-score', '-id'
+        ).select_related('author__profile')
 
     def find_by_id(self, id):
         try:
@@ -160,9 +394,64 @@ class AnswerManager(models.Manager):
         return answer
 
 
+class TagManager(models.Manager):
+    def find_by_name(self, tag):
+        found = self.filter(normalized=tag.lower()).first()
+        if found is None:
+            # Rows added before the column, until normalize_names() fills them
+            found = self.filter(normalized='', tag__iexact=tag).first()
+        return found
+
+    def normalize_names(self):
+        # Fills normalized for rows saved without Tag.save(),
+        # run by `manage.py rebuild_tags`
+        self.filter(normalized='').update(normalized=Lower('tag'))
+
+    def popular(self, count=10):
+        return self.all().order_by('-usage_count')[:count]
+
+    def directory(self):
+        return self.all().order_by('-usage_count', '-id')
+
+    def change_usage(self, tag_ids, delta):
+        self.filter(pk__in=tag_ids).update(usage_count=F('usage_count') + delta)
+
+    def recount_usage(self):
+        # Full recount from the questions-tags table
+        through = Question.tags.through
+        usage = through.objects.filter(tag=OuterRef('pk')).order_by().values(
+            'tag'
+        ).annotate(total=Count('pk')).values('total')
+        self.update(usage_count=Coalesce(
+            Subquery(usage, output_field=IntegerField()), 0
+        ))
+
+
 class ProfileManager(models.Manager):
+    TOP_SIZE = 10
+
     def top_ten(self):
-        return self.all().order_by('-score')[:10]
+        return self.all().order_by('-score')[:self.TOP_SIZE]
+
+    def invalidate_top_ten(self, profiles):
+        # Drop cached best members only if changed profiles are
+        # in the top or could get there
+        top_ten = caching.peek(caching.SIDEBAR_BEST_MEMBERS)
+        if top_ten is None:
+            return
+        top_ids = {p.pk for p in top_ten}
+        threshold = top_ten[-1].score if len(top_ten) >= self.TOP_SIZE else None
+        for profile in profiles:
+            if threshold is None or profile.pk in top_ids or profile.score >= threshold:
+                caching.bump_version(caching.SIDEBAR_BEST_MEMBERS)
+                return
+
+class CommandRunManager(models.Manager):
+    def last_started(self, name):
+        return self.filter(name=name).values_list('started_at', flat=True).first()
+
+    def finish(self, name, started_at):
+        self.update_or_create(name=name, defaults={'started_at': started_at})
 
 # =============================== MANAGERS ENDS ===============================
 
@@ -182,7 +471,7 @@ class Question(models.Model):
         auto_now=True,
         verbose_name='Last modified'
     )
-    tags = models.ManyToManyField('Tag')
+    tags = models.ManyToManyField('Tag', through='QuestionTag')
     author = models.ForeignKey(
         User,
         null=True,
@@ -192,23 +481,60 @@ class Question(models.Model):
     score = models.IntegerField(
         default=0
     )
+    answers_count = models.IntegerField(
+        default=0,
+        verbose_name='Answers count'
+    )
+    hot_rank = models.FloatField(
+        default=0,
+        editable=False
+    )
+    # Last change of score or answers, hot_rank of touched
+    # questions is recomputed by recompute_hot_ranks command
+    touched_at = models.DateTimeField(
+        auto_now=True,
+        db_index=True
+    )
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        self.hot_rank = hot_rank(
+            self.score, self.answers_count, self.date_create or datetime.date.today()
+        )
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = set(update_fields) | {'hot_rank', 'touched_at'}
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'Question'
         verbose_name_plural = 'Questions'
+        indexes = [
+            # QuestionManager.new() and its keyset pages
+            models.Index(fields=['-date_create', '-id'], name='question_new_idx'),
+            # QuestionManager.most_popular()
+            models.Index(fields=['-score', '-id'], name='question_popular_idx'),
+            # QuestionManager.hot()
+            models.Index(fields=['-hot_rank', '-id'], name='question_hot_idx'),
+        ]
 
     # Manager
     objects = QuestionManager()
 
     def update_score(self):
-        vote_sum = self.estimates.aggregate(Sum('vote'))
-        self.score = vote_sum['vote__sum']
+        # Full recount, votes keep score up to date incrementally
+        vote_sum = self.estimates.aggregate(vote_sum=Coalesce(Sum('vote'), 0))
+        self.score = vote_sum['vote_sum']
         self.save(update_fields=['score'])
         return self.score
 
+    def update_answers_count(self):
+        self.answers_count = self.answer_set.count()
+        self.save(update_fields=['answers_count'])
+        return self.answers_count
+
 
 class Answer(models.Model):
     author = models.ForeignKey(
@@ -246,13 +572,21 @@ class Answer(models.Model):
     class Meta:
         verbose_name = 'Answer'
         verbose_name_plural = 'Answers'
+        indexes = [
+            # AnswerManager.most_popular()
+            models.Index(
+                fields=['question', '-is_correct', '-score', '-id'],
+                name='answer_popular_idx'
+            ),
+        ]
 
     # Manager
     objects = AnswerManager()
 
     def update_score(self):
-        vote_sum = self.estimates.aggregate(Sum('vote'))
-        self.score = vote_sum['vote__sum']
+        # Full recount, votes keep score up to date incrementally
+        vote_sum = self.estimates.aggregate(vote_sum=Coalesce(Sum('vote'), 0))
+        self.score = vote_sum['vote_sum']
         self.save(update_fields=['score'])
         return self.score
 
@@ -262,14 +596,65 @@ class Tag(models.Model):
         max_length=100,
         unique=True
     )
+    # Lowercased tag for case-insensitive lookups by index. Existing rows
+    # get it from `manage.py rebuild_tags` (normalize_names())
+    normalized = models.CharField(
+        max_length=100,
+        db_index=True,
+        editable=False,
+        default=''
+    )
+    usage_count = models.IntegerField(
+        default=0,
+        db_index=True,
+        verbose_name='Usage count'
+    )
 
     def __str__(self):
         return self.tag
 
+    def save(self, *args, **kwargs):
+        self.normalized = self.tag.lower()
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = 'Tag'
         verbose_name_plural = 'Tags'
 
+    # Manager
+    objects = TagManager()
+
+
+class QuestionTag(models.Model):
+    # Through table of Question.tags, same table and columns as the
+    # automatic one had
+    question = models.ForeignKey(
+        'Question',
+        on_delete=models.CASCADE,
+        related_name='tag_links'
+    )
+    tag = models.ForeignKey(
+        'Tag',
+        on_delete=models.CASCADE,
+        related_name='question_links'
+    )
+
+    def __str__(self):
+        return f'{self.question_id} - {self.tag_id}'
+
+    class Meta:
+        db_table = 'app_question_tags'
+        verbose_name = 'Question tag'
+        verbose_name_plural = 'Question tags'
+        unique_together = [
+            'question',
+            'tag',
+        ]
+        indexes = [
+            # QuestionManager.find_by_tag()
+            models.Index(fields=['tag', '-question'], name='question_tag_tag_idx'),
+        ]
+
 
 class Profile(models.Model):
     user = models.OneToOneField(
@@ -281,6 +666,12 @@ class Profile(models.Model):
         upload_to='profiles_avatars/',
         blank=True
     )
+    # Small copy of avatar for cards, made by app.thumbnails
+    avatar_thumbnail = models.ImageField(
+        upload_to='profiles_avatars/',
+        blank=True,
+        editable=False
+    )
     nickname = models.CharField(
         max_length=128,
         verbose_name='NickName'
@@ -295,24 +686,145 @@ class Profile(models.Model):
     class Meta:
         verbose_name = 'Profile'
         verbose_name_plural = 'Profiles'
+        indexes = [
+            # ProfileManager.top_ten()
+            models.Index(fields=['-score'], name='profile_score_idx'),
+        ]
 
     # Manager
     objects = ProfileManager()
 
+    # Fields shown by author cards and best members, saves which keep
+    # them (save_user_profile on every login) leave those caches alone
+    SHOWN_FIELDS = ('score', 'nickname', 'avatar', 'avatar_thumbnail')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._shown = instance.shown_values()
+        return instance
+
+    def shown_values(self):
+        # Deferred fields are not loaded for the comparison
+        return tuple(str(self.__dict__.get(name)) for name in self.SHOWN_FIELDS)
+
+    def save(self, *args, **kwargs):
+        # Read by the post_save receivers below
+        self.shown_changed = self.shown_values() != getattr(self, '_shown', None)
+        super().save(*args, **kwargs)
+        # Uploaded avatar gets its storage name while saved
+        self._shown = self.shown_values()
+
+    def set_avatar(self, avatar):
+        # Old thumbnail is dropped, original is shown until the new one is made
+        self.avatar = avatar
+        self.avatar_thumbnail = ''
+
+    @property
+    def avatar_thumbnail_url(self):
+        if self.avatar_thumbnail:
+            return self.avatar_thumbnail.url
+        return self.avatar.url
+
     def get_score_from_questions(self):
-        questions_scores = self.user.questions.aggregate(Sum('score'))
-        return questions_scores['score__sum']
+        questions_scores = self.user.questions.aggregate(
+            score_sum=Coalesce(Sum('score'), 0)
+        )
+        return questions_scores['score_sum']
 
     def get_score_from_answers(self):
-        answers_scores = self.user.answers.aggregate(Sum('score'))
-        return answers_scores['score__sum']
+        answers_scores = self.user.answers.aggregate(
+            score_sum=Coalesce(Sum('score'), 0)
+        )
+        return answers_scores['score_sum']
 
     def update_score(self):
+        # Full recount, votes keep score up to date incrementally
         self.score = self.get_score_from_questions() + self.get_score_from_answers()
         self.save(update_fields=['score'])
         return self.score
 
 
+class QuestionPosting(models.Model):
+    # Inverted index for search: how many times token occurs
+    # in question title, text and its answers
+    token = models.CharField(
+        max_length=64,
+        verbose_name='Token'
+    )
+    question = models.ForeignKey(
+        'Question',
+        on_delete=models.CASCADE,
+        related_name='postings'
+    )
+    frequency = models.IntegerField(
+        default=0,
+        verbose_name='Frequency'
+    )
+
+    def __str__(self):
+        return f'{self.token}: {self.question_id} x{self.frequency}'
+
+    class Meta:
+        verbose_name = 'Question posting'
+        verbose_name_plural = 'Question postings'
+        unique_together = [
+            'token',
+            'question',
+        ]
+
+
+class RelatedQuestion(models.Model):
+    # Top RELATED_QUESTIONS_COUNT questions sharing most tags with
+    # the question, kept by app.related when tags are saved
+    question = models.ForeignKey(
+        'Question',
+        on_delete=models.CASCADE,
+        related_name='related_links'
+    )
+    related = models.ForeignKey(
+        'Question',
+        on_delete=models.CASCADE,
+        related_name='back_links'
+    )
+    weight = models.IntegerField(
+        default=0,
+        verbose_name='Shared tags'
+    )
+
+    def __str__(self):
+        return f'{self.question_id} -> {self.related_id} x{self.weight}'
+
+    class Meta:
+        verbose_name = 'Related question'
+        verbose_name_plural = 'Related questions'
+        unique_together = [
+            'question',
+            'related',
+        ]
+        indexes = [
+            # QuestionManager.related_to()
+            models.Index(fields=['question', '-weight', '-related'], name='related_question_idx'),
+        ]
+
+
+class CommandRun(models.Model):
+    # Start of the last finished run of an incremental management command.
+    # Kept in the database, commands start with an empty local cache
+    name = models.CharField(
+        max_length=100,
+        primary_key=True
+    )
+    started_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Command run'
+        verbose_name_plural = 'Command runs'
+
+    # Manager
+    objects = CommandRunManager()
+
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
@@ -322,3 +834,161 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
     instance.profile.save()
+
+
+@receiver(post_save, sender=Answer)
+def increment_answers_count(sender, instance, created, **kwargs):
+    if created:
+        Question.objects.filter(pk=instance.question_id).update(
+            answers_count=F('answers_count') + 1,
+            touched_at=timezone.now()
+        )
+
+
+@receiver(post_delete, sender=Answer)
+def decrement_answers_count(sender, instance, **kwargs):
+    Question.objects.filter(pk=instance.question_id).update(
+        answers_count=F('answers_count') - 1,
+        touched_at=timezone.now()
+    )
+
+
+@receiver(post_save, sender=Profile)
+def invalidate_best_members(sender, instance, **kwargs):
+    if instance.shown_changed:
+        Profile.objects.invalidate_top_ten([instance])
+
+
+@receiver(post_save, sender=Tag)
+def invalidate_sidebar_tags(sender, instance, **kwargs):
+    caching.bump_version(caching.SIDEBAR_TAGS)
+    caching.bump_version(caching.TAG_INDEX)
+
+
+@receiver(post_delete, sender=Tag)
+def invalidate_sidebar_tags_on_delete(sender, instance, **kwargs):
+    caching.bump_version(caching.SIDEBAR_TAGS)
+    caching.bump_version(caching.TAG_INDEX)
+
+
+@receiver(m2m_changed, sender=Question.tags.through)
+def update_tags_usage(sender, instance, action, reverse, pk_set, **kwargs):
+    # Question.tags.set() sends add/remove with changed tag ids only
+    if reverse or action not in ('pre_clear', 'post_add', 'post_remove'):
+        return
+    if action == 'pre_clear':
+        pk_set = set(instance.tags.values_list('pk', flat=True))
+    if not pk_set:
+        return
+    delta = 1 if action == 'post_add' else -1
+    Tag.objects.change_usage(pk_set, delta)
+    caching.bump_version(caching.SIDEBAR_TAGS)
+
+
+@receiver(pre_delete, sender=Question)
+def release_tags_usage(sender, instance, **kwargs):
+    tag_ids = list(instance.tags.values_list('pk', flat=True))
+    if tag_ids:
+        Tag.objects.change_usage(tag_ids, -1)
+        caching.bump_version(caching.SIDEBAR_TAGS)
+
+
+# Cached question and answer cards are refreshed by new versions
+@receiver(post_save, sender=Question)
+def invalidate_question_card(sender, instance, **kwargs):
+    caching.bump_version(caching.card_name('question', instance.pk))
+
+
+@receiver(m2m_changed, sender=Question.tags.through)
+def invalidate_question_card_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+    if not reverse:
+        if action != 'pre_clear':
+            caching.bump_version(caching.card_name('question', instance.pk))
+        return
+    # tag.question_set changes: pk_set has question ids, clear() has none
+    if action == 'pre_clear':
+        pk_set = tag_question_ids(instance)
+    if action != 'post_clear':
+        invalidate_tag_cards(pk_set)
+
+
+# Cards show names of their tags
+def tag_question_ids(tag):
+    return list(
+        Question.tags.through.objects.filter(tag=tag).values_list('question_id', flat=True)
+    )
+
+
+def invalidate_tag_cards(question_ids):
+    for question_id in question_ids:
+        caching.bump_version(caching.card_name('question', question_id))
+
+
+@receiver(post_save, sender=Tag)
+def invalidate_tag_cards_on_save(sender, instance, created, **kwargs):
+    if created:
+        return
+    question_ids = tag_question_ids(instance)
+    invalidate_tag_cards(question_ids)
+    caching.invalidate_pages(question_ids, [instance.tag])
+
+
+@receiver(pre_delete, sender=Tag)
+def invalidate_tag_cards_on_delete(sender, instance, **kwargs):
+    question_ids = tag_question_ids(instance)
+    invalidate_tag_cards(question_ids)
+    caching.invalidate_pages(question_ids, [instance.tag])
+
+
+@receiver(post_save, sender=Answer)
+def invalidate_answer_card(sender, instance, **kwargs):
+    caching.bump_version(caching.card_name('answer', instance.pk))
+
+
+@receiver(post_save, sender=Profile)
+def invalidate_author_cards(sender, instance, **kwargs):
+    if instance.shown_changed:
+        caching.bump_version(caching.profile_name(instance.user_id))
+
+
+# Profile is saved with every save of the user (save_user_profile)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_cached_user(sender, instance, **kwargs):
+    caching.bump_version(caching.user_name(instance.user_id))
+
+
+# Cached pages are refreshed by new versions of the question and its tags
+def question_tags(question_id):
+    return list(
+        Tag.objects.filter(question__pk=question_id).values_list('tag', flat=True)
+    )
+
+
+@receiver(post_save, sender=Question)
+def invalidate_question_pages(sender, instance, **kwargs):
+    caching.invalidate_pages([instance.pk], question_tags(instance.pk))
+
+
+@receiver(pre_delete, sender=Question)
+def invalidate_question_pages_on_delete(sender, instance, **kwargs):
+    caching.invalidate_pages([instance.pk], question_tags(instance.pk))
+
+
+@receiver(m2m_changed, sender=Question.tags.through)
+def invalidate_tag_pages(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse or action not in ('pre_clear', 'post_add', 'post_remove'):
+        return
+    if action == 'pre_clear':
+        tags = question_tags(instance.pk)
+    else:
+        tags = Tag.objects.filter(pk__in=pk_set).values_list('tag', flat=True)
+    caching.invalidate_pages([instance.pk], tags)
+
+
+@receiver(post_save, sender=Answer)
+@receiver(post_delete, sender=Answer)
+def invalidate_answer_pages(sender, instance, **kwargs):
+    caching.invalidate_pages([instance.question_id], question_tags(instance.question_id))
@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import json
+import re
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from . import caching
+from .models import QuestionVote, AnswerVote
+from .votes import vote_buffer
+
+# Parts of a cached page which are different for every visitor
+USER_BLOCK_RE = re.compile(r'<!-- user-block -->.*?<!-- /user-block -->', re.S)
+USER_VOTES_MARK = '<!-- user-votes -->'
+CSRF_INPUT_RE = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+VOTE_TARGET_RE = re.compile(r'data-target="(question|answer):(\d+)"')
+
+VOTE_MODELS = {
+    'question': QuestionVote,
+    'answer': AnswerVote,
+}
+
+
+def page_key(request, names):
+    # Versions of the sidebar and of the page scopes are a part of the key,
+    # a write bumps them instead of deleting pages
+    versions = caching.get_versions(
+        [caching.SIDEBAR_TAGS, caching.SIDEBAR_BEST_MEMBERS] + names
+    )
+    source = request.get_full_path() + ':' + ':'.join(
+        str(versions[name]) for name in sorted(versions)
+    )
+    return 'page:' + hashlib.md5(source.encode()).hexdigest()
+
+
+def make_entry(response):
+    content = response.content.decode(response.charset)
+    targets = {}
+    for kind, pk in VOTE_TARGET_RE.findall(content):
+        targets.setdefault(kind, set()).add(int(pk))
+    return {
+        'content': content,
+        'content_type': response['Content-Type'],
+        'rendered_at': time.time(),
+        'etag': hashlib.md5(content.encode()).hexdigest(),
+        'targets': targets,
+    }
+
+
+def user_votes(request, targets):
+    votes = {}
+    for kind, target_ids in targets.items():
+        model = VOTE_MODELS[kind]
+        found = model.objects.votes_of(
+            request.user,
+            target_ids,
+            pending=vote_buffer.pending_votes(model, request.user.pk)
+        )
+        for target_id, vote in found.items():
+            votes[f'{kind}:{target_id}'] = vote
+    return votes
+
+
+def personalize(request, entry):
+    # Cached body of the anonymous page with navbar and votes of the user
+    content = entry['content']
+    user_block = '<!-- user-block -->{}<!-- /user-block -->'.format(
+        render_to_string('inc/navbar_user.html', request=request)
+    )
+    content = USER_BLOCK_RE.sub(lambda match: user_block, content, count=1)
+    votes = json.dumps(user_votes(request, entry['targets']))
+    content = content.replace(
+        USER_VOTES_MARK,
+        f'<script id="user-votes" type="application/json">{votes}</script>',
+        1
+    )
+    return content
+
+
+def respond(request, entry):
+    token = get_token(request)
+    if request.user.is_authenticated:
+        content = personalize(request, entry)
+        etag = hashlib.md5(content.encode()).hexdigest()
+    else:
+        content = entry['content']
+        etag = entry['etag']
+
+    # Token is the same for all forms of the page and is not
+    # a part of the etag, so it does not break 304 responses
+    last_modified = int(entry['rendered_at'])
+    response = get_conditional_response(request, etag=f'"{etag}"', last_modified=last_modified)
+    if response is None:
+        content = CSRF_INPUT_RE.sub(lambda match: match[1] + token + match[2], content)
+        response = HttpResponse(content, content_type=entry['content_type'])
+        response['ETag'] = f'"{etag}"'
+        response['Last-Modified'] = http_date(last_modified)
+    patch_vary_headers(response, ['Cookie'])
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True)
+    return response
+
+
+def lookup(request, scopes, kwargs):
+    # (cache key, cached response), key is None when the page is not cached
+    if not settings.PAGE_CACHE_TIMEOUT or request.method not in ('GET', 'HEAD'):
+        return None, None
+    key = page_key(request, scopes(**kwargs))
+    entry = caching.get_cache().get(key)
+    if entry is None:
+        return key, None
+    return key, respond(request, entry)
+
+
+def store(request, key, response):
+    if response.status_code == 200 and not request.user.is_authenticated:
+        entry = make_entry(response)
+        caching.get_cache().set(key, entry, settings.PAGE_CACHE_TIMEOUT)
+        response['ETag'] = '"{}"'.format(entry['etag'])
+        response['Last-Modified'] = http_date(int(entry['rendered_at']))
+        patch_vary_headers(response, ['Cookie'])
+    return response
+
+
+def cache_page_for_anonymous(scopes):
+    # Full page cache of a list view. scopes(**view_kwargs) returns names
+    # of versions the page depends on. Pages are rendered for anonymous
+    # visitors only, logged in users get them with their own navbar.
+    def decorator(view):
+        if asyncio.iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                key, response = await sync_to_async(lookup)(request, scopes, kwargs)
+                if response is not None:
+                    return response
+                response = await view(request, *args, **kwargs)
+                if key is not None:
+                    response = await sync_to_async(store)(request, key, response)
+                return response
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key, response = lookup(request, scopes, kwargs)
+            if response is not None:
+                return response
+            response = view(request, *args, **kwargs)
+            if key is not None:
+                response = store(request, key, response)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,181 @@
+import datetime
+import math
+
+from django.core import signing
+from django.db.models import Q
+from django.http import Http404
+
+TOKEN_SALT = 'app.pagination'
+
+
+def encode_token(data):
+    return signing.dumps(data, salt=TOKEN_SALT, compress=True)
+
+
+def decode_token(token):
+    try:
+        return signing.loads(token, salt=TOKEN_SALT)
+    except signing.BadSignature:
+        raise Http404
+
+
+def _dump_value(value):
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+class CursorPage:
+    # Mimics django.core.paginator.Page for templates
+
+    def __init__(self, object_list, number, paginator,
+                 previous_token=None, next_tokens=None):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self.previous_token = previous_token
+        # Tokens of the following pages: [(number, token), ...]
+        self.next_tokens = next_tokens or []
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return bool(self.next_tokens)
+
+    def has_previous(self):
+        return self.number > 1
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    @property
+    def next_token(self):
+        return self.next_tokens[0][1] if self.next_tokens else None
+
+
+class CursorPaginator:
+    # Keyset pagination: page is selected with a condition on the
+    # ordering fields of the last (or first) row of the neighbour page,
+    # so every page costs the same as the first one.
+
+    def __init__(self, queryset, per_page, count=None, window=5, unique_field=None):
+        self.per_page = per_page
+        self.window = window
+        self.ordering = self.get_ordering(queryset, unique_field)
+        self.fields = [f.lstrip('-') for f in self.ordering]
+        self.queryset = queryset.order_by(*self.ordering)
+        # Approximate total, only for displaying number of pages
+        self._count = count
+
+    @staticmethod
+    def get_ordering(queryset, unique_field=None):
+        # unique_field has no equal values among the rows (e.g. key of
+        # a joined table), ordering by it needs no tiebreaker
+        ordering = list(queryset.query.order_by) or ['-pk']
+        for field in ordering:
+            if not isinstance(field, str) or field.startswith('?'):
+                raise ValueError('Only plain field ordering is supported')
+        unique = {'pk', 'id'} | ({unique_field} if unique_field else set())
+        if not unique & {field.lstrip('-') for field in ordering}:
+            # Unique tiebreaker in the direction of the first field
+            ordering.append('-pk' if ordering[0].startswith('-') else 'pk')
+        return ordering
+
+    @property
+    def count(self):
+        if callable(self._count):
+            self._count = self._count()
+        return self._count
+
+    @count.setter
+    def count(self, value):
+        self._count = value
+
+    @property
+    def num_pages(self):
+        if self.count is None:
+            return None
+        return max(1, math.ceil(self.count / self.per_page))
+
+    def get_key(self, obj):
+        return [_dump_value(getattr(obj, f)) for f in self.fields]
+
+    def keyset_filter(self, key, reverse=False):
+        # Rows strictly after key in ordering (before it if reverse)
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, key):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+        # Range on the first field lets the database use the index
+        first = self.ordering[0]
+        descending = first.startswith('-') != reverse
+        bound = Q(**{f"{first.lstrip('-')}__{'lte' if descending else 'gte'}": key[0]})
+        return bound & condition
+
+    def reversed_ordering(self):
+        return [f[1:] if f.startswith('-') else '-' + f for f in self.ordering]
+
+    def get_page(self, token=None):
+        if token is None:
+            number, key, direction = 1, None, 'after'
+        else:
+            data = decode_token(token)
+            try:
+                number, key, direction = data['n'], data['k'], data['d']
+            except (KeyError, TypeError):
+                raise Http404
+
+        if direction == 'before':
+            rows = list(
+                self.queryset.filter(self.keyset_filter(key, reverse=True))
+                .order_by(*self.reversed_ordering())[:self.per_page]
+            )
+            rows.reverse()
+        else:
+            queryset = self.queryset
+            if key is not None:
+                queryset = queryset.filter(self.keyset_filter(key))
+            rows = list(queryset[:self.per_page])
+
+        if not rows:
+            if number > 1:
+                raise Http404
+            return CursorPage(rows, number, self)
+
+        previous_token = None
+        if number > 2:
+            previous_token = encode_token({
+                'n': number - 1,
+                'k': self.get_key(rows[0]),
+                'd': 'before',
+            })
+
+        # Keys of the next pages come from the index only
+        last_key = self.get_key(rows[-1])
+        following = self.queryset.filter(
+            self.keyset_filter(last_key)
+        ).values_list(*self.fields)[:self.per_page * (self.window - 1)]
+        next_tokens = []
+        page_key = last_key
+        for i, values in enumerate(following):
+            if i % self.per_page == 0:
+                page_number = number + len(next_tokens) + 1
+                next_tokens.append((page_number, encode_token({
+                    'n': page_number,
+                    'k': page_key,
+                    'd': 'after',
+                })))
+            page_key = [_dump_value(v) for v in values]
+
+        return CursorPage(rows, number, self, previous_token, next_tokens)
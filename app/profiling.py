@@ -0,0 +1,229 @@
+import contextvars
+import statistics
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template import engines
+from django.template.backends.django import Template
+
+# Opt-in request profiling (PROFILING in settings). Every request
+# of a worker process gets a record of its wall time, SQL queries,
+# template rendering and context processors, the last
+# PROFILING_BUFFER_SIZE records are kept in memory and summed up by view
+# on /profiling/ for staff. Render time includes context processors and
+# queries made while rendering (lazy sidebar blocks), SQL time includes
+# queries of async views run by app.db pool.
+
+# Queries shown for a request which ran them more than once
+DUPLICATES_SHOWN = 5
+
+_current = contextvars.ContextVar('request_profile', default=None)
+_records = None
+_records_lock = threading.Lock()
+_installed = False
+
+
+class RequestProfile:
+
+    def __init__(self):
+        # (sql, params, seconds), appended by every thread of the request
+        self.queries = []
+        self.render = 0.0
+        self.processors = 0.0
+        self.render_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, repr(params), time.perf_counter() - start))
+
+    def duplicates(self):
+        # Same SQL with the same parameters, most repeated first
+        counts = Counter((sql, params) for sql, params, seconds in self.queries)
+        return [(sql, count) for (sql, params), count in counts.most_common() if count > 1]
+
+    def record(self, request, response, wall):
+        duplicates = self.duplicates()
+        match = request.resolver_match
+        return {
+            'view': match.view_name if match else '<unresolved>',
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'time': time.time(),
+            'wall_ms': wall * 1000,
+            'sql_count': len(self.queries),
+            'sql_ms': sum(seconds for sql, params, seconds in self.queries) * 1000,
+            'render_ms': self.render * 1000,
+            'processors_ms': self.processors * 1000,
+            'duplicates': sum(count - 1 for sql, count in duplicates),
+            'duplicate_sql': [
+                {'sql': sql, 'count': count} for sql, count in duplicates[:DUPLICATES_SHOWN]
+            ],
+        }
+
+
+def enabled():
+    return settings.PROFILING
+
+
+@contextmanager
+def queries_recorded(profile):
+    # Queries of the thread's connections go to the profile
+    with ExitStack() as stack:
+        for conn in connections.all():
+            stack.enter_context(conn.execute_wrapper(profile))
+        yield
+
+
+def track(func):
+    # func run by another thread for the current request, e.g. by
+    # app.db pool, records its queries to the profile of the request
+    profile = _current.get()
+    if profile is None:
+        return func
+
+    def tracked():
+        token = _current.set(profile)
+        try:
+            with queries_recorded(profile):
+                return func()
+        finally:
+            _current.reset(token)
+    return tracked
+
+
+def timed_render(render):
+    def wrapper(self, *args, **kwargs):
+        profile = _current.get()
+        if profile is None:
+            return render(self, *args, **kwargs)
+        # Templates rendered while rendering are counted once
+        profile.render_depth += 1
+        start = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            profile.render_depth -= 1
+            if not profile.render_depth:
+                profile.render += time.perf_counter() - start
+    return wrapper
+
+
+def timed_processor(processor):
+    def wrapper(request):
+        profile = _current.get()
+        if profile is None:
+            return processor(request)
+        start = time.perf_counter()
+        try:
+            return processor(request)
+        finally:
+            profile.processors += time.perf_counter() - start
+    return wrapper
+
+
+def install():
+    # Template rendering and context processors report to the profile
+    # of the current request, outside of a request they are not timed
+    global _installed
+    if _installed:
+        return
+    Template.render = timed_render(Template.render)
+    for backend in engines.all():
+        engine = getattr(backend, 'engine', None)
+        if engine is not None:
+            # Engine keeps loaded processors in a cached property
+            engine.template_context_processors = tuple(
+                timed_processor(processor)
+                for processor in engine.template_context_processors
+            )
+    _installed = True
+
+
+def add_record(record):
+    global _records
+    with _records_lock:
+        if _records is None or _records.maxlen != settings.PROFILING_BUFFER_SIZE:
+            _records = deque(_records or (), maxlen=settings.PROFILING_BUFFER_SIZE)
+        _records.append(record)
+
+
+def records():
+    # Oldest first
+    with _records_lock:
+        return list(_records or ())
+
+
+def clear():
+    with _records_lock:
+        if _records is not None:
+            _records.clear()
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def stats():
+    # Records summed up by view, the most total wall time first
+    by_view = {}
+    for record in records():
+        by_view.setdefault(record['view'], []).append(record)
+    result = []
+    for view, rows in by_view.items():
+        wall = [row['wall_ms'] for row in rows]
+        duplicate_sql = Counter()
+        for row in rows:
+            for query in row['duplicate_sql']:
+                duplicate_sql[query['sql']] += query['count'] - 1
+        result.append({
+            'view': view,
+            'requests': len(rows),
+            'wall_ms_total': sum(wall),
+            'wall_ms_mean': statistics.mean(wall),
+            'wall_ms_p95': percentile(wall, 0.95),
+            'wall_ms_max': max(wall),
+            'sql_count_mean': statistics.mean(row['sql_count'] for row in rows),
+            'sql_ms_mean': statistics.mean(row['sql_ms'] for row in rows),
+            'render_ms_mean': statistics.mean(row['render_ms'] for row in rows),
+            'processors_ms_mean': statistics.mean(row['processors_ms'] for row in rows),
+            'duplicates': sum(row['duplicates'] for row in rows),
+            'duplicate_sql': [
+                {'sql': sql, 'count': count}
+                for sql, count in duplicate_sql.most_common(DUPLICATES_SHOWN)
+            ],
+        })
+    result.sort(key=lambda row: -row['wall_ms_total'])
+    return result
+
+
+class ProfilingMiddleware:
+    # Records every request while PROFILING is on, see above
+
+    def __init__(self, get_response):
+        if not settings.PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        install()
+
+    def __call__(self, request):
+        profile = RequestProfile()
+        token = _current.set(profile)
+        start = time.perf_counter()
+        try:
+            with queries_recorded(profile):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        add_record(profile.record(request, response, time.perf_counter() - start))
+        return response
@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q
+
+from . import caching
+from .models import Question, RelatedQuestion
+
+
+def find_related(question_id, tag_ids, limit):
+    # [(question id, shared tags)] of questions with most common tags,
+    # newer first among equal. The only self-join of the through
+    # table, it runs when tags are saved and never on page views
+    through = Question.tags.through
+    return list(
+        through.objects.filter(tag_id__in=tag_ids)
+        .exclude(question_id=question_id)
+        .values('question_id')
+        .annotate(weight=Count('id'))
+        .order_by('-weight', '-question_id')
+        .values_list('question_id', 'weight')[:limit]
+    )
+
+
+def trim(question_ids):
+    # Keeps top RELATED_QUESTIONS_COUNT links of every question
+    for question_id in question_ids:
+        extra = list(
+            RelatedQuestion.objects.filter(question_id=question_id)
+            .order_by('-weight', '-related_id')
+            .values_list('pk', flat=True)[settings.RELATED_QUESTIONS_COUNT:]
+        )
+        if extra:
+            RelatedQuestion.objects.filter(pk__in=extra).delete()
+
+
+def build_links(question_id, tag_ids):
+    # Own top links of the question, used when the whole index is built
+    found = find_related(question_id, tag_ids, settings.RELATED_QUESTIONS_COUNT)
+    return [
+        RelatedQuestion(question_id=question_id, related_id=related_id, weight=weight)
+        for related_id, weight in found
+    ]
+
+
+def index_question(question):
+    # Links of the question after its tags are set. The question also
+    # enters lists of the candidates where it is among the best
+    tag_ids = list(question.tags.values_list('pk', flat=True))
+    with transaction.atomic():
+        links = RelatedQuestion.objects.filter(Q(question=question) | Q(related=question))
+        affected = set(links.filter(related=question).values_list('question_id', flat=True))
+        links.delete()
+
+        found = []
+        if tag_ids:
+            found = find_related(question.pk, tag_ids, settings.RELATED_CANDIDATES)
+        RelatedQuestion.objects.bulk_create([
+            RelatedQuestion(question=question, related_id=related_id, weight=weight)
+            for related_id, weight in found[:settings.RELATED_QUESTIONS_COUNT]
+        ] + [
+            RelatedQuestion(question_id=related_id, related=question, weight=weight)
+            for related_id, weight in found
+        ])
+        affected.update(related_id for related_id, weight in found)
+        trim(affected)
+    # Cached answers pages of questions whose block has changed
+    caching.invalidate_pages(affected)
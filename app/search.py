@@ -0,0 +1,117 @@
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, Sum, Value, When
+from django.db.models.functions import Ln
+
+from .models import Question, QuestionPosting
+
+TOKEN_RE = re.compile(r'\w+')
+TOKEN_MAX_LENGTH = 64
+# Title words count as several occurrences
+TITLE_WEIGHT = 3
+
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'how',
+    'in', 'is', 'it', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was',
+    'what', 'with',
+}
+
+
+def tokenize(text):
+    return [
+        token[:TOKEN_MAX_LENGTH]
+        for token in TOKEN_RE.findall(text.lower())
+        if len(token) > 1 and token not in STOP_WORDS
+    ]
+
+
+def count_tokens(*texts, weight=1):
+    counter = Counter()
+    for text in texts:
+        for token in tokenize(text):
+            counter[token] += weight
+    return counter
+
+
+def question_tokens(question):
+    counter = count_tokens(question.title, weight=TITLE_WEIGHT)
+    counter.update(count_tokens(question.text))
+    return counter
+
+
+def add_postings(question_id, counter):
+    # Adds token occurrences to postings of one question
+    if not counter:
+        return
+    with transaction.atomic():
+        existing = {
+            posting.token: posting
+            for posting in QuestionPosting.objects.select_for_update().filter(
+                question_id=question_id,
+                token__in=counter.keys()
+            )
+        }
+        for token, posting in existing.items():
+            posting.frequency += counter[token]
+        QuestionPosting.objects.bulk_update(existing.values(), ['frequency'])
+        QuestionPosting.objects.bulk_create([
+            QuestionPosting(token=token, question_id=question_id, frequency=count)
+            for token, count in counter.items()
+            if token not in existing
+        ])
+
+
+def index_question(question):
+    # Full reindex of the question with all its answers
+    counter = question_tokens(question)
+    for text in question.answer_set.values_list('text', flat=True):
+        counter.update(count_tokens(text))
+    with transaction.atomic():
+        QuestionPosting.objects.filter(question=question).delete()
+        QuestionPosting.objects.bulk_create([
+            QuestionPosting(token=token, question=question, frequency=count)
+            for token, count in counter.items()
+        ])
+
+
+def index_answer(answer):
+    add_postings(answer.question_id, count_tokens(answer.text))
+
+
+def search_questions(query):
+    # Questions ranked by TF-IDF of query tokens plus score
+    tokens = set(tokenize(query))
+    if not tokens:
+        return Question.objects.none()
+
+    document_frequency = QuestionPosting.objects.filter(
+        token__in=tokens
+    ).values('token').annotate(df=Count('pk')).values_list('token', 'df')
+    total = max(Question.objects.approximate_count(), 1)
+    idf = {
+        token: math.log(1 + total / df)
+        for token, df in document_frequency
+    }
+    if not idf:
+        return Question.objects.none()
+
+    token_idf = Case(
+        *[When(postings__token=token, then=Value(value)) for token, value in idf.items()],
+        default=Value(0.0),
+        output_field=FloatField()
+    )
+    questions = Question.objects.filter(
+        postings__token__in=idf.keys()
+    ).annotate(
+        relevance=Sum(Ln(F('postings__frequency') + 1) * token_idf, output_field=FloatField())
+    ).annotate(
+        rank=ExpressionWrapper(
+            F('relevance') + Value(settings.SEARCH_SCORE_WEIGHT) * F('score'),
+            output_field=FloatField()
+        )
+    ).order_by('-rank', '-id')
+    return Question.objects.list_plan(questions)
@@ -0,0 +1,162 @@
+import gzip
+import json
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.base import ContentFile
+from django.http import FileResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSED_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.json', '.txt')
+# Smaller files fit into one packet anyway
+COMPRESS_MIN_SIZE = 256
+SOURCE_MAP_RE = re.compile(r'^\s*(//|/\*)# sourceMappingURL=.*$', re.M)
+
+
+def minify_css(text):
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    # Space before ':' may be a descendant selector (a :hover), keep it
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    text = re.sub(r':\s+', ':', text)
+    return text.replace(';}', '}').strip()
+
+
+def join_js(texts):
+    # Scripts are minified already, only source map links are dropped
+    return ';\n'.join(SOURCE_MAP_RE.sub('', text).strip() for text in texts)
+
+
+def compressed_versions(content):
+    # {extension: bytes} of pre-compressed copies worth keeping
+    versions = {'.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        versions['.br'] = brotli.compress(content, quality=11)
+    return {
+        extension: data for extension, data in versions.items()
+        if len(data) < len(content)
+    }
+
+
+class BundleStorage(ManifestStaticFilesStorage):
+    # collectstatic builds STATIC_BUNDLES, hashes every file name and
+    # writes .gz (and .br with brotli installed) copies next to them
+
+    def stored_name(self, name):
+        # Before collectstatic (tests, development) files keep their names
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def build_bundle(self, name, sources, paths):
+        texts = []
+        for source in sources:
+            storage, path = paths[source]
+            with storage.open(path) as source_file:
+                texts.append(source_file.read().decode())
+        if name.endswith('.css'):
+            content = '\n'.join(minify_css(text) for text in texts)
+        else:
+            content = join_js(texts)
+        if self.exists(name):
+            self.delete(name)
+        self._save(name, ContentFile(content.encode()))
+
+    def compress(self, name):
+        if not name.endswith(COMPRESSED_EXTENSIONS):
+            return
+        with self.open(name) as original:
+            content = original.read()
+        if len(content) < COMPRESS_MIN_SIZE:
+            return
+        for extension, data in compressed_versions(content).items():
+            if self.exists(name + extension):
+                self.delete(name + extension)
+            self._save(name + extension, ContentFile(data))
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        paths = dict(paths)
+        for name, sources in settings.STATIC_BUNDLES.items():
+            self.build_bundle(name, sources, paths)
+            paths[name] = (self, name)
+            yield name, name, True
+
+        yield from super().post_process(paths, dry_run, **options)
+
+        names = set(self.hashed_files) | set(self.hashed_files.values())
+        for name in sorted(names):
+            self.compress(name)
+
+
+class StaticFilesMiddleware:
+    # Serves collected static files in production, under WSGI and ASGI.
+    # Files are indexed once at start, a request costs no disk lookups
+    # except opening the file. Hashed names are cached by browsers for
+    # a year, they change with the content
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        root = settings.STATIC_ROOT
+        if settings.DEBUG or not root or not os.path.isdir(root):
+            raise MiddlewareNotUsed
+        self.prefix = settings.STATIC_URL
+        self.files = {}
+        for directory, _, names in os.walk(root):
+            for name in names:
+                path = os.path.join(directory, name)
+                url = self.prefix + os.path.relpath(path, root).replace(os.sep, '/')
+                self.files[url] = path
+        self.immutable = set()
+        manifest = os.path.join(root, BundleStorage.manifest_name)
+        if os.path.exists(manifest):
+            with open(manifest) as manifest_file:
+                hashed = json.load(manifest_file)['paths'].values()
+            self.immutable = {self.prefix + name for name in hashed}
+
+    def choose_file(self, request, url):
+        # Pre-compressed copy accepted by the client, if there is one
+        accepted = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        for extension, encoding in (('.br', 'br'), ('.gz', 'gzip')):
+            if encoding in accepted and url + extension in self.files:
+                return self.files[url + extension], encoding
+        return self.files[url], None
+
+    def serve(self, request, url):
+        path, encoding = self.choose_file(request, url)
+        stat = os.stat(path)
+        etag = '"{:x}-{:x}"'.format(int(stat.st_mtime), stat.st_size)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=int(stat.st_mtime)
+        )
+        if response is None:
+            content_type = mimetypes.guess_type(url)[0] or 'application/octet-stream'
+            response = FileResponse(open(path, 'rb'), content_type=content_type)
+            response['Content-Length'] = stat.st_size
+            response['Last-Modified'] = http_date(stat.st_mtime)
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        if url in self.immutable:
+            response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        else:
+            response['Cache-Control'] = 'public, max-age=60'
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+    def __call__(self, request):
+        url = request.path_info
+        if request.method in ('GET', 'HEAD') and url in self.files:
+            return self.serve(request, url)
+        return self.get_response(request)
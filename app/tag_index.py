@@ -0,0 +1,71 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from . import caching
+from .models import Tag
+
+
+class TagIndex:
+    # Tags sorted by lowercased name, a prefix is a range found by bisect
+
+    def __init__(self, rows, version):
+        # rows: (normalized, tag, id, usage_count) sorted by normalized
+        self.rows = rows
+        self.keys = [row[0] for row in rows]
+        self.version = version
+        self.built_at = time.monotonic()
+
+    @classmethod
+    def build(cls, version):
+        rows = list(
+            Tag.objects.order_by('normalized').values_list(
+                'normalized', 'tag', 'id', 'usage_count'
+            )
+        )
+        return cls(rows, version)
+
+    def search(self, prefix, limit):
+        # Most used of the first TAG_AUTOCOMPLETE_SCAN tags with the prefix
+        prefix = prefix.lower()
+        start = bisect_left(self.keys, prefix)
+        found = []
+        for row in self.rows[start:start + settings.TAG_AUTOCOMPLETE_SCAN]:
+            if not row[0].startswith(prefix):
+                break
+            found.append(row)
+        found.sort(key=lambda row: (-row[3], row[0]))
+        return [
+            {'id': pk, 'tag': tag, 'count': usage_count}
+            for normalized, tag, pk, usage_count in found[:limit]
+        ]
+
+
+# Every worker process has its own copy, caching.TAG_INDEX
+# version is bumped when tags are saved or deleted
+_index = None
+_lock = threading.Lock()
+
+
+def get_index():
+    # Rebuilt after tag changes and every TAG_INDEX_MAX_AGE seconds,
+    # usage counts change without saving tags
+    global _index
+    version = caching.get_version(caching.TAG_INDEX)
+    index = _index
+    if index is not None and index.version == version and (
+        time.monotonic() - index.built_at < settings.TAG_INDEX_MAX_AGE
+    ):
+        return index
+    with _lock:
+        if _index is index:
+            _index = TagIndex.build(version)
+        return _index
+
+
+def autocomplete(prefix, limit=None):
+    if not prefix:
+        return []
+    return get_index().search(prefix, limit or settings.TAG_AUTOCOMPLETE_LIMIT)
@@ -0,0 +1,23 @@
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+register = template.Library()
+
+
+def is_collected(name):
+    # Bundles exist only after collectstatic with BundleStorage
+    return name in getattr(staticfiles_storage, 'hashed_files', {})
+
+
+@register.simple_tag
+def bundle(name):
+    # One tag for the bundle, or for each of its files before it is built
+    names = [name] if is_collected(name) else settings.STATIC_BUNDLES[name]
+    if name.endswith('.css'):
+        html = '<link rel="stylesheet" href="{}">\n'
+    else:
+        html = '<script src="{}"></script>\n'
+    return format_html_join('', html, ((static(n),) for n in names))
@@ -0,0 +1,135 @@
+import os
+import sys
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from . import views
+from .models import Question, Tag, User
+
+# Set ASKME_PERF_REPORT=1 to print measurements of every route
+REPORT = os.environ.get('ASKME_PERF_REPORT') == '1'
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.time += time.perf_counter() - start
+
+
+class RenderTimer:
+    def __init__(self):
+        self.time = 0.0
+
+    def wrap(self, render):
+        def timed_render(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return render(*args, **kwargs)
+            finally:
+                self.time += time.perf_counter() - start
+        return timed_render
+
+
+class BudgetTestMixin:
+    size = None
+
+    @classmethod
+    def setUpTestData(cls):
+        # Fast hasher, seeding hundreds of users with PBKDF2 takes minutes
+        with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']):
+            call_command('seed', size=cls.size, stdout=StringIO())
+        cls.user = User.objects.order_by('pk').first()
+        cls.question = Question.objects.order_by('-answers_count').first()
+        cls.tag = Tag.objects.order_by('-usage_count').first()
+        cls.results = []
+
+    @classmethod
+    def tearDownClass(cls):
+        if REPORT:
+            for name, queries, sql_ms, render_ms in cls.results:
+                sys.stderr.write(
+                    f'\n{cls.size:>6} {name:>10}: {queries:3} queries, '
+                    f'sql {sql_ms:7.2f} ms, render {render_ms:7.2f} ms'
+                )
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        # Budgets are for views, not for pages served from the cache,
+        # with sessions and users cached as with a shared cache
+        page_cache = self.settings(
+            PAGE_CACHE_TIMEOUT=0,
+            SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+            USER_CACHE_ENABLED=True
+        )
+        page_cache.enable()
+        self.addCleanup(page_cache.disable)
+
+    def routes(self):
+        # (url name, url kwargs, logged in, query string)
+        return [
+            ('home', {}, False, ''),
+            ('hot', {}, False, ''),
+            ('answers', {'question_id': self.question.pk}, False, ''),
+            ('tag', {'tag': self.tag.tag}, False, ''),
+            ('tags', {}, False, ''),
+            ('search', {}, False, f'?q={self.question.title.split()[0]}'),
+            ('ask', {}, True, ''),
+            ('settings', {}, True, ''),
+            ('login', {}, False, ''),
+            ('register', {}, False, ''),
+        ]
+
+    def measure(self, url):
+        recorder = QueryRecorder()
+        timer = RenderTimer()
+        with mock.patch.object(views, 'render', timer.wrap(views.render)):
+            with connection.execute_wrapper(recorder):
+                response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, url)
+        return recorder.count, recorder.time * 1000, timer.time * 1000
+
+    def test_budgets(self):
+        for name, kwargs, login, query in self.routes():
+            with self.subTest(route=name):
+                self.client.logout()
+                if login:
+                    self.client.force_login(self.user)
+                url = reverse(name, kwargs=kwargs) + query
+                # First request fills caches, budgets are for warm ones
+                self.client.get(url)
+                queries, sql_ms, render_ms = self.measure(url)
+                self.results.append((name, queries, sql_ms, render_ms))
+
+                budget = settings.PERFORMANCE_BUDGETS[name]
+                self.assertLessEqual(queries, budget['queries'], f'{name}: SQL queries')
+                self.assertLessEqual(sql_ms, budget['sql_ms'], f'{name}: SQL time, ms')
+                self.assertLessEqual(render_ms, budget['render_ms'], f'{name}: render time, ms')
+
+
+class SmallBudgetTest(BudgetTestMixin, TestCase):
+    size = 'small'
+
+
+class MediumBudgetTest(BudgetTestMixin, TestCase):
+    size = 'medium'
+
+
+class LargeBudgetTest(BudgetTestMixin, TestCase):
+    size = 'large'
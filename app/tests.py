@@ -1,3 +1,985 @@
-from django.test import TestCase
+import os
+import re
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import AnonymousUser
+from django.core import signing
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.http import QueryDict
+from django.template import Template, Context
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import async_views, caching, db, profiling, search, tag_index, thumbnails, views
+from .context_processors import best_members, popular_tags
+from .models import Question, Answer, Profile, Tag, User, QuestionVote, AnswerVote, RelatedQuestion
+from .forms import AnswerForm, QuestionForm
+from .pagination import CursorPaginator, encode_token
+from .staticfiles import minify_css
+from PIL import Image
+from .votes import vote_buffer, vote_limiter
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class ListQueriesTest(TestCase):
+    # List pages must issue the same number of queries
+    # however many cards are on the page
+
+    def setUp(self):
+        cache.clear()
+        self.tags = [Tag.objects.create(tag=f'tag{i}') for i in range(3)]
+
+    def create_user(self, name):
+        user = User.objects.create(username=name)
+        user.profile.nickname = name
+        user.profile.save()
+        return user
+
+    def create_questions(self, count):
+        questions = []
+        for i in range(count):
+            author = self.create_user(f'q_author_{Question.objects.count()}')
+            question = Question.objects.create(title='Title', text='Text', author=author)
+            question.tags.set(self.tags)
+            questions.append(question)
+        return questions
+
+    def create_answers(self, question, count):
+        for i in range(count):
+            author = self.create_user(f'a_author_{Answer.objects.count()}')
+            Answer.objects.create(question=question, text='Text', author=author)
+
+    def count_queries(self, url):
+        # Warm sidebar and counters cache, then measure
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_index(self):
+        self.create_questions(1)
+        one_card = self.count_queries(reverse('home'))
+        self.create_questions(14)
+        self.assertEqual(one_card, self.count_queries(reverse('home')))
+
+    def test_tag_questions(self):
+        self.create_questions(1)
+        url = reverse('tag', kwargs={'tag': self.tags[0].tag})
+        one_card = self.count_queries(url)
+        self.create_questions(9)
+        self.assertEqual(one_card, self.count_queries(url))
+
+    def test_answers(self):
+        question = self.create_questions(1)[0]
+        url = reverse('answers', kwargs={'question_id': question.pk})
+        self.create_answers(question, 1)
+        one_card = self.count_queries(url)
+        self.create_answers(question, 9)
+        self.assertEqual(one_card, self.count_queries(url))
+
+    def test_list_plan(self):
+        self.create_questions(5)
+        with self.assertNumQueries(2):
+            for question in Question.objects.new()[:5]:
+                question.author.profile.avatar
+                list(question.tags.all())
+
+    def test_tag_questions_are_paged(self):
+        self.create_questions(7)
+        url = reverse('tag', kwargs={'tag': self.tags[0].tag.upper()})
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        question_queries = [
+            q['sql'] for q in queries
+            if re.search(r'FROM \W?app_question\W? ', q['sql'])
+        ]
+        self.assertTrue(question_queries)
+        for sql in question_queries:
+            self.assertIn('LIMIT', sql)
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN output of SQLite')
+    def test_tag_questions_plan(self):
+        # Pages are read in the order of the through table index,
+        # without sorting the questions of the tag
+        self.create_questions(12)
+        queryset = Question.objects.find_by_tag(self.tags[0])
+        paginator = CursorPaginator(queryset, 5, unique_field=Question.objects.TAG_PAGE_KEY)
+        last = paginator.get_page()[-1]
+        for page in (queryset[:5], paginator.queryset.filter(paginator.keyset_filter(paginator.get_key(last)))[:5]):
+            plan = page.explain()
+            self.assertIn('question_tag_tag_idx', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_tag_without_questions(self):
+        url = reverse('tag', kwargs={'tag': self.tags[0].tag})
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class CursorPaginationTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        # Ties on every field but id: same date, three scores
+        for i in range(12):
+            Question.objects.create(title=f'Question {i}', text='Text', author=self.author, score=i % 3)
+
+    def walk(self, queryset, per_page=5, unique_field=None):
+        # Pages forward to the end, then back to the first one
+        paginator = CursorPaginator(queryset, per_page, unique_field=unique_field)
+        pages = [paginator.get_page()]
+        while pages[-1].has_next():
+            pages.append(paginator.get_page(pages[-1].next_token))
+        backward = [pages[-1]]
+        while backward[-1].previous_token:
+            backward.append(paginator.get_page(backward[-1].previous_token))
+        return pages, backward
+
+    def ids(self, page):
+        return [question.pk for question in page]
+
+    def test_walk_on_ties(self):
+        for queryset in (Question.objects.new(), Question.objects.most_popular()):
+            expected = list(queryset.values_list('pk', flat=True))
+            pages, backward = self.walk(queryset)
+            self.assertEqual([len(page) for page in pages], [5, 5, 2])
+            self.assertEqual(sum((self.ids(page) for page in pages), []), expected)
+            # Page 2 is the last one with a previous token, page 1 has a link without it
+            self.assertEqual([page.number for page in backward], [3, 2])
+            self.assertEqual(self.ids(backward[1]), self.ids(pages[1]))
+
+    def test_walk_tag_questions(self):
+        tag = Tag.objects.create(tag='tag')
+        tag.question_set.set(Question.objects.all())
+        queryset = Question.objects.find_by_tag(tag)
+        pages, backward = self.walk(queryset, unique_field=Question.objects.TAG_PAGE_KEY)
+        expected = list(Question.objects.order_by('-pk').values_list('pk', flat=True))
+        self.assertEqual(sum((self.ids(page) for page in pages), []), expected)
+        self.assertEqual(self.ids(backward[1]), self.ids(pages[1]))
+
+    def test_window_tokens(self):
+        paginator = CursorPaginator(Question.objects.most_popular(), 5)
+        first = paginator.get_page()
+        self.assertEqual([number for number, token in first.next_tokens], [2, 3])
+        third = paginator.get_page(first.next_tokens[1][1])
+        self.assertEqual(self.ids(third), list(
+            Question.objects.most_popular().values_list('pk', flat=True)
+        )[10:])
+
+    def test_bad_cursor(self):
+        url = reverse('hot')
+        self.assertEqual(self.client.get(url, {'cursor': 'garbage'}).status_code, 404)
+        forged = signing.dumps({'n': 2, 'k': [0, 0], 'd': 'after'}, salt='other')
+        self.assertEqual(self.client.get(url, {'cursor': forged}).status_code, 404)
+        broken = encode_token({'page': 2})
+        self.assertEqual(self.client.get(url, {'cursor': broken}).status_code, 404)
+        past_end = encode_token({'n': 2, 'k': [-1000, 0], 'd': 'after'})
+        self.assertEqual(self.client.get(url, {'cursor': past_end}).status_code, 404)
+
+
+class SearchTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.tag = Tag.objects.create(tag='tag')
+
+    def post(self, data):
+        request = RequestFactory().post('/', data)
+        request.user = self.author
+        return request
+
+    def ask(self, title, text):
+        request = self.post({'title': title, 'text': text, 'tags': [self.tag.pk]})
+        form = QuestionForm(data=request.POST, request=request)
+        self.assertTrue(form.is_valid(), form.errors)
+        return form.save()
+
+    def answer(self, question, text):
+        request = self.post({'text': text})
+        form = AnswerForm(data=request.POST, request=request, question_id=question.pk)
+        self.assertTrue(form.is_valid(), form.errors)
+        return form.save()
+
+    def found(self, query):
+        return list(search.search_questions(query))
+
+    def test_tokenize(self):
+        self.assertEqual(
+            search.tokenize('How to use the Django ORM, a 2nd time?'),
+            ['use', 'django', 'orm', '2nd', 'time']
+        )
+        self.assertEqual(len(search.tokenize('x' * 100)[0]), search.TOKEN_MAX_LENGTH)
+
+    def test_postings_kept_on_save(self):
+        question = self.ask('Django signals', 'Receivers run after save')
+        frequencies = dict(question.postings.values_list('token', 'frequency'))
+        self.assertEqual(frequencies['django'], search.TITLE_WEIGHT)
+        self.assertEqual(frequencies['receivers'], 1)
+        self.assertEqual(self.found('receivers'), [question])
+
+        self.answer(question, 'Receivers or overriding save')
+        self.assertEqual(question.postings.get(token='receivers').frequency, 2)
+        self.assertEqual(self.found('overriding'), [question])
+        self.assertEqual(self.found('the'), [])
+
+    def test_ranking(self):
+        in_text = self.ask('Question about models', 'Migrations of models')
+        in_title = self.ask('Migrations', 'Squashing them')
+        self.ask('Unrelated', 'Nothing here')
+        self.assertEqual(self.found('migrations'), [in_title, in_text])
+        # Score counts with SEARCH_SCORE_WEIGHT
+        Question.objects.filter(pk=in_text.pk).update(score=1000)
+        self.assertEqual(self.found('migrations'), [in_text, in_title])
+
+    def test_view(self):
+        question = self.ask('Caching pages', 'Text')
+        response = self.client.get(reverse('search'), {'q': 'CACHING'})
+        self.assertEqual(list(response.context['page_obj']), [question])
+
+
+class RecountTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.tags = [Tag.objects.create(tag=f'tag{i}') for i in range(2)]
+
+    def recompute(self):
+        call_command('rebuild_tags', stdout=StringIO())
+
+    def test_tag_usage(self):
+        question = Question.objects.create(title='Title', text='Text', author=self.author)
+        question.tags.set(self.tags[:1])
+        Tag.objects.update(usage_count=0)
+        self.recompute()
+        self.assertEqual(list(Tag.objects.popular(1)), self.tags[:1])
+        self.assertEqual(Tag.objects.get(pk=self.tags[0].pk).usage_count, 1)
+
+    def test_tags_before_normalized(self):
+        tag = self.tags[0]
+        question = Question.objects.create(title='Title', text='Text', author=self.author)
+        question.tags.set([tag])
+        Tag.objects.filter(pk=tag.pk).update(normalized='')
+        url = reverse('tag', args=[tag.tag.upper()])
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.recompute()
+        self.assertEqual(Tag.objects.get(pk=tag.pk).normalized, 'tag0')
+        self.assertEqual(tag_index.autocomplete('TAG0')[0]['id'], tag.pk)
+
+
+
+class RecomputeReputationTest(TestCase):
+
+    def test_restores_corrupted_counters(self):
+        author = User.objects.create(username='author')
+        voters = [User.objects.create(username=f'voter{i}') for i in range(3)]
+        question = Question.objects.create(title='Title', text='Text', author=author)
+        answer = Answer.objects.create(question=question, text='Text', author=author)
+        for voter in voters:
+            QuestionVote.objects.record(question, voter, 1)
+        AnswerVote.objects.record(answer, voters[0], -1)
+
+        Question.objects.update(score=100, answers_count=7)
+        Answer.objects.update(score=100)
+        Profile.objects.update(score=100)
+        call_command('recompute_reputation', posts=True, batch_size=1, stdout=StringIO())
+
+        question.refresh_from_db()
+        answer.refresh_from_db()
+        self.assertEqual((question.score, question.answers_count), (3, 1))
+        self.assertEqual(answer.score, -1)
+        self.assertEqual(Profile.objects.get(user=author).score, 2)
+        self.assertEqual(Profile.objects.get(user=voters[0]).score, 0)
+
+    def test_profiles_only_without_posts(self):
+        author = User.objects.create(username='author')
+        question = Question.objects.create(title='Title', text='Text', author=author)
+        Question.objects.filter(pk=question.pk).update(score=5)
+        call_command('recompute_reputation', stdout=StringIO())
+        self.assertEqual(Profile.objects.get(user=author).score, 5)
+        question.refresh_from_db()
+        self.assertEqual(question.score, 5)
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class VoteTest(TestCase):
+
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+        self.voter = User.objects.create(username='voter')
+        self.question = Question.objects.create(title='Title', text='Text', author=self.author)
+        self.url = reverse('vote_question', kwargs={'question_id': self.question.pk})
+        self.client.force_login(self.voter)
+        # User ids are reused between tests
+        vote_limiter.buckets.clear()
+
+    def tearDown(self):
+        vote_buffer.flush()
+
+    def vote(self, action):
+        return self.client.post(self.url, {'action': action}).json()
+
+    def test_burst_is_written_once(self):
+        self.assertEqual(self.vote('like'), {'vote': 1, 'score': 1})
+        self.assertEqual(self.vote('dislike'), {'vote': -1, 'score': -1})
+        self.assertEqual(self.vote('like'), {'vote': 1, 'score': 1})
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.score, 0)
+
+        with CaptureQueriesContext(connection) as queries:
+            vote_buffer.flush()
+        score_updates = [
+            q for q in queries
+            if re.match(r'UPDATE \W?app_question\W? SET', q['sql'])
+        ]
+        self.assertEqual(len(score_updates), 1)
+        self.question.refresh_from_db()
+        self.author.profile.refresh_from_db()
+        self.assertEqual(self.question.score, 1)
+        self.assertEqual(self.author.profile.score, 1)
+        self.assertEqual(QuestionVote.objects.get(user=self.voter).vote, 1)
+
+    def test_click_without_writes(self):
+        # The first click reads the vote, the next ones touch no vote rows
+        for action, expected in (('like', 1), ('dislike', -1)):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.vote(action)['vote'], expected)
+            vote_queries = [q['sql'] for q in queries if 'app_questionvote' in q['sql']]
+            self.assertEqual(len(vote_queries), 1 if expected == 1 else 0)
+            self.assertTrue(all(sql.startswith('SELECT') for sql in vote_queries))
+        self.assertFalse(QuestionVote.objects.exists())
+        vote_buffer.flush()
+        self.assertEqual(QuestionVote.objects.get(user=self.voter).vote, -1)
+
+    def test_burst_of_voters(self):
+        answer = Answer.objects.create(question=self.question, text='Text', author=self.author)
+        for i in range(3):
+            self.client.force_login(User.objects.create(username=f'voter{i}'))
+            self.vote('like')
+            self.client.post(reverse('vote_answer', kwargs={'answer_id': answer.pk}), {'action': 'like'})
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(vote_buffer.flush(), 6)
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE')]
+        for table, count in (('app_question', 1), ('app_answer', 1), ('app_profile', 2)):
+            table_updates = [sql for sql in updates if re.match(rf'UPDATE \W?{table}\W? SET', sql)]
+            self.assertEqual(len(table_updates), count, table)
+        self.question.refresh_from_db()
+        self.author.profile.refresh_from_db()
+        self.assertEqual(self.question.score, 3)
+        self.assertEqual(self.author.profile.score, 6)
+
+    def test_failed_flush_keeps_votes(self):
+        self.vote('like')
+        with mock.patch.object(type(QuestionVote.objects), 'apply_deltas', side_effect=DatabaseError):
+            with self.assertLogs('app.votes', 'ERROR'):
+                self.assertEqual(vote_buffer.flush(), 0)
+        self.assertEqual(vote_buffer.pending_votes(QuestionVote, self.voter.pk), {self.question.pk: 1})
+        self.assertFalse(QuestionVote.objects.filter(user=self.voter).exists())
+        self.assertEqual(vote_buffer.flush(), 1)
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.score, 1)
+
+    def test_record(self):
+        self.assertEqual(QuestionVote.objects.record(self.question, self.voter, 1), 0)
+        self.assertEqual(QuestionVote.objects.record(self.question, self.voter, -1), 1)
+        self.assertEqual(QuestionVote.objects.record(self.question, self.voter, -1), -1)
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.score, -1)
+        self.assertEqual(QuestionVote.objects.filter(question=self.question).count(), 1)
+
+    def test_like_and_dislike(self):
+        vote = QuestionVote.objects.find_or_create(self.question, self.voter)
+        vote.like()
+        self.question.refresh_from_db()
+        self.assertEqual(self.question.score, 1)
+        vote.dislike()
+        vote.dislike()
+        self.question.refresh_from_db()
+        self.author.profile.refresh_from_db()
+        self.assertEqual((self.question.score, self.author.profile.score), (0, 0))
+        self.assertEqual(QuestionVote.objects.get(pk=vote.pk).vote, QuestionVote.UNVOTED)
+
+    @skipUnless(connection.vendor == 'mysql', 'INSERT ... ON DUPLICATE KEY UPDATE is MySQL only')
+    def test_upsert_mysql(self):
+        manager = QuestionVote.objects
+        self.assertEqual(manager.upsert_mysql(connection, self.question.pk, self.voter.pk, 1), 0)
+        self.assertEqual(manager.upsert_mysql(connection, self.question.pk, self.voter.pk, -1), 1)
+        self.assertEqual(manager.upsert_mysql(connection, self.question.pk, self.voter.pk, -1), -1)
+        other = User.objects.create(username='other')
+        self.assertEqual(manager.upsert_mysql(connection, self.question.pk, other.pk, 1), 0)
+        votes = QuestionVote.objects.filter(question=self.question).values_list('user', 'vote')
+        self.assertEqual(sorted(votes), sorted([(self.voter.pk, -1), (other.pk, 1)]))
+
+    def test_vote_state_on_list(self):
+        other = Question.objects.create(title='Other', text='Text', author=self.author)
+        QuestionVote.objects.record(self.question, self.voter, 1)
+        self.vote('dislike')
+        self.client.get(reverse('home'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('home'))
+        votes = {q.pk: q.user_vote for q in response.context['page_obj']}
+        self.assertEqual(votes, {self.question.pk: -1, other.pk: 0})
+        vote_queries = [q for q in queries if 'app_questionvote' in q['sql']]
+        self.assertEqual(len(vote_queries), 1)
+
+    def test_rate_limit(self):
+        for i in range(vote_limiter.capacity):
+            self.vote('like')
+        response = self.client.post(self.url, {'action': 'like'})
+        self.assertEqual(response.status_code, 429)
+
+    def test_anonymous(self):
+        self.client.logout()
+        response = self.client.post(self.url, {'action': 'like'})
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class CardCacheTest(TestCase):
+    # Cached question cards are replaced when what they show changes
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.tags = [Tag.objects.create(tag=f'tag{i}') for i in range(2)]
+        self.question = Question.objects.create(title='Old title', text='Text', author=self.author)
+        self.question.tags.set(self.tags[:1])
+
+    def home(self):
+        # Cards only, the sidebar lists tags too
+        content = self.client.get(reverse('home')).content.decode()
+        return content[content.index('class="questions"'):content.index('class="sidebar"')]
+
+    def test_title(self):
+        self.assertIn('Old title', self.home())
+        self.question.title = 'New title'
+        self.question.save()
+        self.assertIn('New title', self.home())
+
+    def test_tag_set(self):
+        self.assertNotIn('tag1', self.home())
+        self.question.tags.set(self.tags[1:])
+        content = self.home()
+        self.assertIn('tag1', content)
+        self.assertNotIn('tag0', content)
+        self.tags[0].question_set.add(self.question)
+        self.assertIn('tag0', self.home())
+
+    def test_tag_rename_and_delete(self):
+        self.assertIn('tag0', self.home())
+        self.tags[0].tag = 'renamed'
+        self.tags[0].save()
+        content = self.home()
+        self.assertIn('renamed', content)
+        self.assertNotIn('tag0', content)
+        self.tags[0].delete()
+        self.assertNotIn('renamed', self.home())
+
+
+class PageCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.author.profile.nickname = 'author'
+        self.author.profile.save()
+        self.question = Question.objects.create(title='Title', text='Text', author=self.author)
+        self.url = reverse('answers', kwargs={'question_id': self.question.pk})
+
+    def test_anonymous_hit(self):
+        first = self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(self.url)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(first['ETag'], second['ETag'])
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=second['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_user_fragment(self):
+        voter = User.objects.create(username='voter')
+        voter.profile.nickname = 'voter_nick'
+        voter.profile.save()
+        QuestionVote.objects.record(self.question, voter, 1)
+        self.client.force_login(voter)
+        Client().get(self.url)
+
+        response = self.client.get(self.url)
+        self.assertTemplateNotUsed(response, 'answers.html')
+        self.assertContains(response, 'voter_nick')
+        self.assertContains(response, f'{{"question:{self.question.pk}": 1}}')
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_invalidated_by_answer(self):
+        self.client.get(self.url)
+        Answer.objects.create(question=self.question, text='New answer', author=self.author)
+        self.assertContains(self.client.get(self.url), 'New answer')
+
+
+class SidebarCacheTest(TestCase):
+    # Best members and popular tags are built once and rebuilt only
+    # when what they show changes
+
+    def setUp(self):
+        cache.clear()
+        self.member = User.objects.create(username='member')
+        self.member.profile.nickname = 'old_nick'
+        self.member.profile.save()
+        author = User.objects.create(username='author')
+        author.profile.nickname = 'author_nick'
+        author.profile.save()
+        self.question = Question.objects.create(title='Title', text='Text', author=author)
+        self.tag = Tag.objects.create(tag='tag')
+        self.question.tags.set([self.tag])
+
+    def sidebar(self):
+        content = self.client.get(reverse('home')).content.decode()
+        return content[content.index('class="sidebar"'):]
+
+    def versions(self):
+        return caching.get_versions([
+            caching.SIDEBAR_BEST_MEMBERS, caching.profile_name(self.member.pk)
+        ])
+
+    def test_built_once(self):
+        best_members()
+        popular_tags()
+        with self.assertNumQueries(0):
+            best_members()
+            popular_tags()
+
+    def test_login_keeps_sidebar(self):
+        self.sidebar()
+        versions = self.versions()
+        self.client.force_login(self.member)
+        self.assertEqual(self.versions(), versions)
+        self.member.profile.save()
+        self.assertEqual(self.versions(), versions)
+
+    def test_nickname(self):
+        self.assertIn('old_nick', self.sidebar())
+        profile = Profile.objects.get(user=self.member)
+        profile.nickname = 'new_nick'
+        profile.save()
+        content = self.sidebar()
+        self.assertIn('new_nick', content)
+        self.assertNotIn('old_nick', content)
+
+    def test_vote_changes_score(self):
+        self.assertIn('author_nick | Score: 0', self.sidebar())
+        QuestionVote.objects.record(self.question, self.member, 1)
+        self.assertIn('author_nick | Score: 1', self.sidebar())
+
+    def test_popular_tags(self):
+        self.assertIn('>tag<', self.sidebar())
+        self.tag.tag = 'renamed'
+        self.tag.save()
+        self.assertIn('>renamed<', self.sidebar())
+
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=0)
+class AsyncViewsTest(TransactionTestCase):
+    # Async views give the same pages as sync ones. Data is committed,
+    # so their queries really run in other threads
+
+    def setUp(self):
+        cache.clear()
+        author = User.objects.create(username='author')
+        tag = Tag.objects.create(tag='tag')
+        self.question = Question.objects.create(title='Title', text='Text', author=author)
+        self.question.tags.set([tag])
+        Answer.objects.create(question=self.question, text='Answer text', author=author)
+
+    def assertSamePage(self, sync_view, async_view, url, **kwargs):
+        def get(view):
+            request = RequestFactory().get(url)
+            request.user = AnonymousUser()
+            response = view(request, **kwargs)
+            self.assertEqual(response.status_code, 200)
+            # Forms have a new CSRF token every time
+            return re.sub(r'name="csrfmiddlewaretoken" value="\w+"', '', response.content.decode())
+
+        self.assertEqual(get(sync_view), get(async_to_sync(async_view)))
+
+    def test_index(self):
+        self.assertSamePage(views.index, async_views.index, reverse('home'))
+
+    def test_tag_questions(self):
+        url = reverse('tag', kwargs={'tag': 'tag'})
+        self.assertSamePage(views.tag_questions, async_views.tag_questions, url, tag='tag')
+
+    def test_answers(self):
+        url = reverse('answers', kwargs={'question_id': self.question.pk})
+        self.assertSamePage(
+            views.answers, async_views.answers, url, question_id=self.question.pk
+        )
+
+
+class ThumbnailTest(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = self.settings(MEDIA_ROOT=media.name, AVATAR_THUMBNAIL_WORKERS=0)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+        content = BytesIO()
+        Image.new('RGB', (600, 400), 'red').save(content, 'PNG')
+        self.profile = User.objects.create(username='user').profile
+        self.profile.set_avatar(SimpleUploadedFile('avatar.png', content.getvalue()))
+        self.profile.save()
+
+    def test_backfill(self):
+        self.assertEqual(self.profile.avatar_thumbnail_url, self.profile.avatar.url)
+        call_command('make_avatar_thumbnails', workers=1, stdout=StringIO())
+        self.profile.refresh_from_db()
+        self.assertTrue(self.profile.avatar_thumbnail.name.endswith('.thumb.webp'))
+        self.assertEqual(self.profile.avatar_thumbnail_url, self.profile.avatar_thumbnail.url)
+        with Image.open(self.profile.avatar_thumbnail.path) as thumbnail:
+            self.assertEqual(thumbnail.size, (128, 128))
+            self.assertEqual(thumbnail.format, 'WEBP')
+
+    def set_avatar(self, profile, name, image_format):
+        content = BytesIO()
+        Image.new('RGB', (200, 200), 'blue').save(content, image_format)
+        profile.set_avatar(SimpleUploadedFile(name, content.getvalue()))
+        profile.save()
+        # schedule() waits for a commit which never comes in TestCase
+        thumbnails.make_thumbnail_by_id(profile.pk)
+
+    def test_same_name_other_extension(self):
+        other = User.objects.create(username='other').profile
+        self.set_avatar(other, 'avatar.jpg', 'JPEG')
+        thumbnails.make_thumbnail_by_id(self.profile.pk)
+        self.profile.refresh_from_db()
+        other.refresh_from_db()
+        self.assertNotEqual(self.profile.avatar_thumbnail.name, other.avatar_thumbnail.name)
+        self.assertTrue(other.avatar_thumbnail.name.endswith('avatar.jpg.thumb.webp'))
+
+    def test_avatar_changed_while_rendering(self):
+        stale = Profile.objects.get(pk=self.profile.pk)
+        self.set_avatar(self.profile, 'new.png', 'PNG')
+        stale.avatar_thumbnail = ''
+        self.assertIsNone(thumbnails.make_thumbnail(stale))
+        self.profile.refresh_from_db()
+        self.assertTrue(self.profile.avatar_thumbnail.name.endswith('new.png.thumb.webp'))
+        thumbnail_dir = os.path.dirname(self.profile.avatar_thumbnail.path)
+        self.assertEqual(
+            sorted(name for name in os.listdir(thumbnail_dir) if '.thumb.' in name),
+            [os.path.basename(self.profile.avatar_thumbnail.name)]
+        )
+
+    def test_cards_refreshed(self):
+        name = caching.profile_name(self.profile.user_id)
+        version = caching.get_version(name)
+        call_command('make_avatar_thumbnails', workers=1, stdout=StringIO())
+        self.assertNotEqual(caching.get_version(name), version)
+
+
+class StaticBundleTest(TestCase):
+
+    def test_minify_css(self):
+        css = '/* card */\n.card a :hover ,\n.card > p {\n    color: red;\n    margin: 0 auto;\n}\n'
+        self.assertEqual(minify_css(css), '.card a :hover,.card>p{color:red;margin:0 auto}')
+
+    def test_sources_before_collectstatic(self):
+        html = Template("{% load bundles %}{% bundle 'css/answers.bundle.css' %}").render(Context())
+        self.assertInHTML('<link rel="stylesheet" href="/static/css/answers.css">', html)
+        self.assertInHTML('<link rel="stylesheet" href="/static/css/score.css">', html)
+
+
+class ConnectionHealthTest(TestCase):
+
+    def wrapper(self, idle, usable):
+        conn = mock.Mock(connection=object(), in_atomic_block=False)
+        conn.used_at = -idle
+        conn.is_usable.return_value = usable
+        return conn
+
+    @override_settings(DB_HEALTH_CHECK_INTERVAL=10)
+    def test_idle_connection_is_checked(self):
+        with mock.patch('time.monotonic', return_value=0):
+            fresh = self.wrapper(idle=1, usable=False)
+            dropped = self.wrapper(idle=60, usable=False)
+            alive = self.wrapper(idle=60, usable=True)
+            db.check_connections([fresh, dropped, alive])
+        fresh.is_usable.assert_not_called()
+        dropped.close.assert_called_once()
+        alive.close.assert_not_called()
+
+    @override_settings(DB_POOL_SIZE=3)
+    def test_pool_per_process(self):
+        with mock.patch.object(db, '_executor', None):
+            executor = db.executor()
+            self.assertEqual(executor._max_workers, 3)
+            self.assertIs(db.executor(), executor)
+            with mock.patch('os.getpid', return_value=-1):
+                self.assertIsNot(db.executor(), executor)
+
+
+@skipUnless(connection.vendor == 'mysql', 'KILL of a MySQL connection')
+class DroppedConnectionTest(TransactionTestCase):
+    # A real connection killed by the server is replaced before reuse
+
+    @override_settings(DB_HEALTH_CHECK_INTERVAL=0)
+    def test_killed_connection_is_replaced(self):
+        connection.ensure_connection()
+        killed = connection.connection.thread_id()
+        other = connection.copy()
+        try:
+            with other.cursor() as cursor:
+                cursor.execute('KILL %s', [killed])
+        finally:
+            other.close()
+        db.check_connections([connection])
+        self.assertIsNone(connection.connection)
+        self.assertEqual(Question.objects.count(), 0)
+        self.assertNotEqual(connection.connection.thread_id(), killed)
+
+
+class HotQuestionsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+
+    def create_question(self, title, days_ago=0):
+        question = Question.objects.create(title=title, text='Text', author=self.author)
+        if days_ago:
+            Question.objects.filter(pk=question.pk).update(
+                date_create=question.date_create - timedelta(days=days_ago)
+            )
+        return question
+
+    def recompute(self, **options):
+        out = StringIO()
+        call_command('recompute_hot_ranks', stdout=out, **options)
+        return out.getvalue()
+
+    def test_old_popular_question_decays(self):
+        old = self.create_question('Old', days_ago=30)
+        Question.objects.filter(pk=old.pk).update(score=1000)
+        new = self.create_question('New')
+        Answer.objects.create(question=new, text='Answer', author=self.author)
+        self.recompute(all=True)
+        self.assertEqual(list(Question.objects.hot()), [new, old])
+
+    def test_only_touched_questions(self):
+        question = self.create_question('Touched')
+        self.create_question('Quiet')
+        self.assertIn('Recomputed 2 questions', self.recompute(all=True))
+        for name in ('voter1', 'voter2'):
+            QuestionVote.objects.record(question, User.objects.create(username=name), 1)
+        self.assertIn('Recomputed 1 questions', self.recompute())
+        self.assertEqual(Question.objects.hot()[0], question)
+
+    def test_marker_outlives_cache(self):
+        # Every command starts with an empty local memory cache
+        self.create_question('First')
+        self.assertIn('Recomputed 1 questions', self.recompute())
+        cache.clear()
+        self.assertIn('Recomputed 0 questions', self.recompute())
+
+
+class RelatedQuestionsTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author')
+        self.tags = [Tag.objects.create(tag=f'tag{i}') for i in range(3)]
+
+    def ask(self, title, tags):
+        request = RequestFactory().post('/ask/', {
+            'title': title,
+            'text': 'Text',
+            'tags': [tag.pk for tag in tags],
+        })
+        request.user = self.author
+        form = QuestionForm(data=request.POST, request=request)
+        self.assertTrue(form.is_valid(), form.errors)
+        return form.save()
+
+    def related(self, question):
+        return list(Question.objects.related_to(question.pk))
+
+    def test_kept_on_save(self):
+        first = self.ask('First', self.tags)
+        second = self.ask('Second', self.tags[:1])
+        third = self.ask('Third', self.tags[:2])
+        self.assertEqual(self.related(first), [third, second])
+        self.assertEqual(self.related(third), [first, second])
+        self.assertEqual(self.related(second), [third, first])
+
+    @override_settings(RELATED_QUESTIONS_COUNT=1)
+    def test_top_k(self):
+        first = self.ask('First', self.tags)
+        self.ask('Second', self.tags[:1])
+        third = self.ask('Third', self.tags[:2])
+        self.assertEqual(self.related(first), [third])
+        self.assertEqual(RelatedQuestion.objects.filter(question=first).count(), 1)
+
+    def test_served_with_one_query(self):
+        first = self.ask('First', self.tags)
+        self.ask('Second', self.tags)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(self.related(first)), 1)
+
+
+class TagAutocompleteTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        for name, usage in (('python', 5), ('pytest', 9), ('Pyramid', 1), ('django', 7)):
+            Tag.objects.create(tag=name, usage_count=usage)
+
+    def names(self, prefix):
+        return [tag['tag'] for tag in tag_index.autocomplete(prefix)]
+
+    def test_prefix_by_usage(self):
+        self.assertEqual(self.names('py'), ['pytest', 'python', 'Pyramid'])
+        self.assertEqual(self.names('PYT'), ['pytest', 'python'])
+        self.assertEqual(self.names('x'), [])
+        self.assertEqual(self.names(''), [])
+
+    def test_rebuilt_on_tag_change(self):
+        self.assertEqual(self.names('dj'), ['django'])
+        Tag.objects.create(tag='djangorestframework', usage_count=10)
+        self.assertEqual(self.names('dj'), ['djangorestframework', 'django'])
+        with self.assertNumQueries(0):
+            self.names('dj')
+
+    def test_endpoint(self):
+        response = self.client.get(reverse('tag_autocomplete'), {'q': 'dj'})
+        self.assertEqual(response.json()['tags'][0]['tag'], 'django')
+
+    def test_ask_page_without_all_tags(self):
+        user = User.objects.create(username='author')
+        self.client.force_login(user)
+        response = self.client.get(reverse('ask'))
+        self.assertContains(response, reverse('tag_autocomplete'))
+        self.assertNotContains(response, '<option')
+
+    def test_form_options(self):
+        chosen = Tag.objects.get(tag='django')
+        for data in ({'tags': [chosen.pk]}, QueryDict(f'tags={chosen.pk}')):
+            form = QuestionForm(data=data)
+            self.assertEqual(list(form.fields['tags'].queryset), [chosen])
+        self.assertEqual(list(QuestionForm().fields['tags'].queryset), [])
+
+    def test_directory(self):
+        response = self.client.get(reverse('tags'))
+        self.assertContains(response, reverse('tag', args=['pytest']))
+
+
+@override_settings(PROFILING=True, PAGE_CACHE_TIMEOUT=0)
+class ProfilingTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        profiling.clear()
+        self.author = User.objects.create(username='author')
+        for i in range(3):
+            Question.objects.create(title=f'Question {i}', text='Text', author=self.author)
+
+    def test_records_view(self):
+        self.client.get(reverse('home'))
+        record = profiling.records()[-1]
+        self.assertEqual(record['view'], 'home')
+        self.assertGreater(record['sql_count'], 0)
+        self.assertGreater(record['render_ms'], 0)
+        self.assertGreater(record['processors_ms'], 0)
+        self.assertGreaterEqual(record['wall_ms'], record['render_ms'])
+
+    def test_duplicates(self):
+        profile = profiling.RequestProfile()
+        with profiling.queries_recorded(profile):
+            for i in range(3):
+                list(Question.objects.filter(pk=1))
+            list(Question.objects.filter(pk=2))
+        self.assertEqual(len(profile.duplicates()), 1)
+        self.assertEqual(profile.duplicates()[0][1], 3)
+
+    @override_settings(PROFILING_BUFFER_SIZE=2)
+    def test_ring_buffer(self):
+        for name in ('home', 'hot', 'tags'):
+            self.client.get(reverse(name))
+        self.assertEqual([record['view'] for record in profiling.records()], ['hot', 'tags'])
+
+    def test_staff_only(self):
+        self.client.get(reverse('home'))
+        self.client.force_login(self.author)
+        self.assertEqual(self.client.get(reverse('profiling_export')).status_code, 302)
+        self.author.is_staff = True
+        self.author.save()
+        response = self.client.get(reverse('profiling_export'))
+        self.assertIn('home', [row['view'] for row in response.json()['stats']])
+        self.assertContains(self.client.get(reverse('profiling')), 'home')
+
+
+@override_settings(
+    SESSION_ENGINE='django.contrib.sessions.backends.cached_db',
+    USER_CACHE_ENABLED=True
+)
+class CachedUserTest(TestCase):
+    # As with a shared cache (SHARED_CACHE in settings)
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='user')
+        self.user.set_password('secret')
+        self.user.save()
+        self.client.force_login(self.user)
+        self.client.get(reverse('settings'))
+
+    def test_warm_request_without_queries(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('ask'))
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(USER_CACHE_ENABLED=False)
+    def test_disabled(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('ask'))
+        self.assertContains(response, 'user')
+        self.assertTrue(any('auth_user' in q['sql'] for q in queries))
+
+    def test_settings_save_replaces_user(self):
+        response = self.client.post(reverse('settings'), {
+            'username': 'user',
+            'email': 'user@example.com',
+            'nickname': 'Renamed',
+        })
+        self.assertContains(response, 'Renamed')
+        self.assertContains(self.client.get(reverse('ask')), 'Renamed')
+
+    def test_settings_save_keeps_score(self):
+        Profile.objects.filter(user=self.user).update(score=10)
+        self.client.post(reverse('settings'), {
+            'username': 'user',
+            'email': 'user@example.com',
+            'nickname': 'Renamed',
+        })
+        self.assertEqual(Profile.objects.get(user=self.user).score, 10)
+
+    def test_password_change_logs_out(self):
+        self.user.set_password('changed')
+        self.user.save()
+        response = self.client.get(reverse('ask'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_login_page_keeps_session_clean(self):
+        self.client.logout()
+        self.client.get(reverse('login'))
+        self.assertNotIn('sessionid', self.client.cookies)
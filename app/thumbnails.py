@@ -0,0 +1,108 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, features
+
+from . import caching
+
+logger = logging.getLogger(__name__)
+
+# Pillow releases the GIL while decoding, resizing and encoding,
+# so threads resize several avatars at once
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.AVATAR_THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails'
+        )
+    return _executor
+
+
+def thumbnail_format():
+    # WebP is several times smaller, JPEG if Pillow is built without it
+    if settings.AVATAR_THUMBNAIL_FORMAT == 'WEBP' and not features.check('webp'):
+        return 'JPEG'
+    return settings.AVATAR_THUMBNAIL_FORMAT
+
+
+def thumbnail_name(name):
+    # profiles_avatars/me.png -> profiles_avatars/me.png.thumb.webp, the
+    # extension is kept so me.png and me.jpg have different thumbnails
+    extension = 'webp' if thumbnail_format() == 'WEBP' else 'jpg'
+    return f'{name}.thumb.{extension}'
+
+
+def render_thumbnail(source):
+    size = settings.AVATAR_THUMBNAIL_SIZE
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image = ImageOps.fit(image.convert('RGB'), (size, size), Image.LANCZOS)
+    content = BytesIO()
+    image.save(content, thumbnail_format(), quality=settings.AVATAR_THUMBNAIL_QUALITY)
+    return content.getvalue()
+
+
+def make_thumbnail(profile):
+    # Saves the thumbnail next to the avatar of the profile
+    from .models import Profile
+    avatar = profile.avatar
+    old_name = profile.avatar_thumbnail.name
+    with avatar.open('rb'):
+        content = render_thumbnail(avatar)
+    # Storage picks a free name, a thumbnail in use is never overwritten
+    name = avatar.storage.save(thumbnail_name(avatar.name), ContentFile(content))
+    # Written only if the avatar and the thumbnail are still the ones
+    # read above, the avatar may be changed while the image was rendered
+    updated = Profile.objects.filter(
+        pk=profile.pk, avatar=avatar.name, avatar_thumbnail=old_name
+    ).update(avatar_thumbnail=name)
+    if not updated:
+        avatar.storage.delete(name)
+        return None
+    if old_name:
+        avatar.storage.delete(old_name)
+    profile.avatar_thumbnail = name
+    # update() sends no post_save, cached cards and users are refreshed here
+    caching.bump_version(caching.profile_name(profile.user_id))
+    caching.bump_version(caching.user_name(profile.user_id))
+    return name
+
+
+def make_thumbnail_by_id(profile_id, force=False):
+    from .models import Profile
+    try:
+        profile = Profile.objects.get(pk=profile_id)
+        # Skipped if the avatar is already gone or has a thumbnail
+        if profile.avatar and (force or not profile.avatar_thumbnail):
+            return make_thumbnail(profile)
+    except Exception:
+        logger.exception('Thumbnail of profile %s is not made', profile_id)
+
+
+def make_thumbnail_in_pool(profile_id, force=False):
+    try:
+        return make_thumbnail_by_id(profile_id, force)
+    finally:
+        close_old_connections()
+
+
+def schedule(profile):
+    # Thumbnail of a new avatar is made after the transaction commits,
+    # in the pool or right away if AVATAR_THUMBNAIL_WORKERS is 0
+    if not profile.avatar or profile.avatar_thumbnail:
+        return
+
+    def submit():
+        if settings.AVATAR_THUMBNAIL_WORKERS:
+            get_executor().submit(make_thumbnail_in_pool, profile.pk)
+        else:
+            make_thumbnail_by_id(profile.pk)
+    transaction.on_commit(submit)
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+from . import caching
+from .models import Profile
+
+# The logged in user with the profile used by the navbar is kept in the
+# cache, a warm request loads neither of them. Entries are versioned by
+# user (caching.user_name), saving the user or the profile (settings
+# page, login) replaces them for every session of the user at once.
+# Without a shared cache (USER_CACHE_ENABLED) users are loaded as usual.
+
+
+def load_user(request):
+    user = auth.get_user(request)
+    if user.is_authenticated:
+        profile = Profile.objects.filter(user=user).first()
+        if profile is not None:
+            user.profile = profile
+    return user
+
+
+def get_user(request):
+    if not settings.USER_CACHE_ENABLED:
+        return auth.get_user(request)
+    user_id = request.session.get(SESSION_KEY)
+    if user_id is None or request.session.get(BACKEND_SESSION_KEY) not in settings.AUTHENTICATION_BACKENDS:
+        return auth.get_user(request)
+
+    cache = caching.get_cache()
+    name = caching.user_name(user_id)
+    key = f'{name}:{caching.get_version(name)}'
+    user = cache.get(key)
+    if user is None:
+        user = load_user(request)
+        if user.is_authenticated:
+            cache.set(key, user, settings.USER_CACHE_TIMEOUT)
+        return user
+
+    # Same check as auth.get_user: the session belongs to the current
+    # password, otherwise auth.get_user flushes it
+    session_hash = request.session.get(HASH_SESSION_KEY)
+    if not (session_hash and constant_time_compare(session_hash, user.get_session_auth_hash())):
+        return auth.get_user(request)
+    return user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    # AuthenticationMiddleware with request.user from the cache
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
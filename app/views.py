@@ -4,6 +4,7 @@ from django.template import RequestContext, Template
 from django.core.paginator import Paginator
 from django.views.generic import ListView
 from django.views.decorators.http import require_GET, require_POST
+from django.views.decorators.csrf import ensure_csrf_cookie
 from django.http import Http404
 from django.core.files.storage import FileSystemStorage
 from django.views import View
@@ -13,33 +14,125 @@ from django.db.models import Sum
 from django.contrib import auth
 from django.urls import reverse
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from .forms import QuestionForm, AnswerForm, LoginForm, RegistrationForm, UserSettingsForm, ProfileSettingsForm
 
-from .models import Profile, Question, Answer, Tag, QuestionVote, AnswerVote
+from .models import Profile, Question, Answer, Tag, QuestionVote, AnswerVote, User
+from .pagination import CursorPaginator
+from .search import search_questions
+from . import caching
+from .caching import attach_card_versions
+from .page_cache import cache_page_for_anonymous
+from .votes import vote_buffer, vote_limiter
+from . import profiling, tag_index
+
+# Number of page links shown in pagination
+PAGES_WINDOW = 5
+
+
+def page_url(request, name=None, value=None):
+    # Link to another page keeping the rest of query string
+    params = request.GET.copy()
+    params.pop('page', None)
+    params.pop('cursor', None)
+    if name is not None and value is not None:
+        params[name] = value
+    return '?' + params.urlencode()
 
 
 def paginate(request, per_page, model_list):
     paginator = Paginator(model_list, per_page)
-    page_number = int(request.GET.get('page', 1))
+    try:
+        page_number = int(request.GET.get('page', 1))
+    except ValueError:
+        raise Http404
     if page_number > paginator.num_pages:
         raise Http404
 
     obj_list = paginator.get_page(page_number)
-    max_range = int(page_number) + 5
+    window = range(
+        obj_list.number,
+        min(obj_list.number + PAGES_WINDOW, paginator.num_pages + 1)
+    )
+    page_links = {
+        'first': page_url(request, 'page', 1) if obj_list.number != 1 else None,
+        'previous': page_url(request, 'page', obj_list.previous_page_number()) if obj_list.has_previous() else None,
+        'window': [(i, page_url(request, 'page', i)) for i in window],
+        'next': page_url(request, 'page', obj_list.next_page_number()) if obj_list.has_next() else None,
+        'last': page_url(request, 'page', paginator.num_pages) if obj_list.has_next() else None,
+    }
+    context = {
+        "page_obj": obj_list,
+        "page_links": page_links,
+    }
+    return context
+
+
+def paginate_by_cursor(request, per_page, model_list, count=None, unique_field=None):
+    # Keyset pagination over ordering of model_list, count is
+    # an approximate total (number or callable) for the page counter
+    paginator = CursorPaginator(
+        model_list, per_page, count=count, window=PAGES_WINDOW, unique_field=unique_field
+    )
+    obj_list = paginator.get_page(request.GET.get('cursor'))
+
+    window = [(obj_list.number, '#')]
+    window += [(i, page_url(request, 'cursor', token)) for i, token in obj_list.next_tokens]
+    page_links = {
+        'first': page_url(request) if obj_list.has_previous() else None,
+        'previous': page_url(request, 'cursor', obj_list.previous_token) if obj_list.has_previous() else None,
+        'window': window,
+        'next': page_url(request, 'cursor', obj_list.next_token) if obj_list.has_next() else None,
+        'last': None,
+        'approx_pages': paginator.num_pages,
+    }
     context = {
         "page_obj": obj_list,
-        "max_range": max_range,
+        "page_links": page_links,
     }
     return context
 
 
+def attach_votes(request, objects, vote_model):
+    # Vote of current user for every card of the page
+    return vote_model.objects.attach_to(
+        objects,
+        request.user,
+        pending=vote_buffer.pending_votes(vote_model, request.user.pk)
+    )
+
+
+def prepare_cards(request, objects, vote_model, kind):
+    # Per user vote and version of cached card for every object
+    attach_votes(request, objects, vote_model)
+    return attach_card_versions(objects, kind)
+
+
+@cache_page_for_anonymous(lambda: [caching.PAGES_QUESTIONS])
+@ensure_csrf_cookie
 def index(request):
     # Index page
     questions = Question.objects.new()
-    context = paginate(request, 5, questions)
+    context = paginate_by_cursor(
+        request, 5, questions,
+        count=Question.objects.approximate_count
+    )
+    prepare_cards(request, context['page_obj'], QuestionVote, 'question')
     return render(request, 'index.html', context)
 
 
+@cache_page_for_anonymous(lambda: [caching.PAGES_QUESTIONS])
+@ensure_csrf_cookie
+def hot(request):
+    # Questions with recent votes and answers first
+    context = paginate_by_cursor(
+        request, 5, Question.objects.hot(),
+        count=Question.objects.approximate_count
+    )
+    prepare_cards(request, context['page_obj'], QuestionVote, 'question')
+    return render(request, 'hot.html', context)
+
+
 @login_required
 def ask_question(request):
     # Page for create new Question
@@ -53,12 +146,18 @@ def ask_question(request):
     return render(request, 'create_question.html', {'form': form})
 
 
+@cache_page_for_anonymous(lambda question_id: [caching.question_pages_name(question_id)])
+@ensure_csrf_cookie
 def answers(request, question_id):
     # Page with answers on current question
     question = Question.objects.find_by_id(question_id)
     q_answers = Answer.objects.most_popular(question)
-    context = paginate(request, 5, q_answers)
+    context = paginate_by_cursor(
+        request, 5, q_answers,
+        count=question.answers_count
+    )
     context['question'] = question
+    context['related'] = Question.objects.related_to(question_id)
     if request.method == 'GET':
         form = AnswerForm()
     else:
@@ -71,41 +170,125 @@ def answers(request, question_id):
         else:
             return redirect(reverse('login') + f'?next={request.path}')
     context['form'] = form
+    attach_votes(request, [question], QuestionVote)
+    prepare_cards(request, context['page_obj'], AnswerVote, 'answer')
     return render(request, 'answers.html', context)
 
 
+@cache_page_for_anonymous(lambda tag: [caching.tag_pages_name(tag)])
+@ensure_csrf_cookie
 def tag_questions(request, tag):
     # Page with question on one tag
-    cur_tag = Tag.objects.filter(tag=tag).first()
+    cur_tag = Tag.objects.find_by_name(tag)
     if not cur_tag:
         raise Http404
-    tag_qs = Question.objects.find_by_tag(tag)
+    tag_qs = Question.objects.find_by_tag(cur_tag)
 
-    context = paginate(request, 5, tag_qs)
+    context = paginate_by_cursor(
+        request, 5, tag_qs,
+        count=cur_tag.usage_count,
+        unique_field=Question.objects.TAG_PAGE_KEY
+    )
+    # The first page is empty only if the tag has no questions
+    if not context['page_obj']:
+        raise Http404
     context['tag'] = f'{tag}'
+    prepare_cards(request, context['page_obj'], QuestionVote, 'question')
 
     return render(request, 'tag_questions.html', context)
 
 
+@ensure_csrf_cookie
+def search(request):
+    # Page with questions found by text
+    query = request.GET.get('q', '').strip()
+    questions = search_questions(query)
+    context = paginate(request, 5, questions)
+    context['query'] = query
+    prepare_cards(request, context['page_obj'], QuestionVote, 'question')
+    return render(request, 'search.html', context)
+
+
+def vote(request, vote_model, target):
+    # Likes and dislikes are buffered, response has expected values
+    if not request.user.is_authenticated:
+        return JsonResponse({
+            'error': 'Log in to vote',
+            'login_url': reverse('login'),
+        }, status=401)
+
+    action = request.POST.get('action')
+    if action not in ('like', 'dislike'):
+        return JsonResponse({'error': 'Unknown action'}, status=400)
+    if not vote_limiter.consume(request.user.pk):
+        return JsonResponse({'error': 'Too many votes, try later'}, status=429)
+
+    # Only the first click of a burst reads the vote
+    current = vote_buffer.pending_vote(vote_model, target.pk, request.user.pk)
+    if current is None:
+        current = vote_model.objects.vote_of(request.user, target)
+    new_vote, pending_delta = vote_buffer.add(
+        vote_model, target.pk, request.user.pk, current, action
+    )
+    return JsonResponse({
+        'vote': new_vote,
+        'score': target.score + pending_delta,
+    })
+
+
+@cache_page_for_anonymous(lambda: [])
+@ensure_csrf_cookie
+def tags(request):
+    # All tags, most used first
+    context = paginate_by_cursor(
+        request, 30, Tag.objects.directory(),
+        count=Tag.objects.count
+    )
+    return render(request, 'tags.html', context)
+
+
+@require_GET
+def tag_autocomplete(request):
+    # Tags starting with ?q= for the ask form
+    return JsonResponse({'tags': tag_index.autocomplete(request.GET.get('q', '').strip())})
+
+
+@require_POST
+def vote_question(request, question_id):
+    question = get_object_or_404(Question.objects.only('pk', 'score'), pk=question_id)
+    return vote(request, QuestionVote, question)
+
+
+@require_POST
+def vote_answer(request, answer_id):
+    answer = get_object_or_404(Answer.objects.only('pk', 'score'), pk=answer_id)
+    return vote(request, AnswerVote, answer)
+
+
 @login_required
 def settings(request):
     if request.method == 'GET':
         user_form = UserSettingsForm(instance=request.user)
         profile_form = ProfileSettingsForm(instance=request.user.profile)
     else:
+        # request.user comes from the cache (app/user_cache.py), saves
+        # start from fresh rows not to write back an old score
+        user = User.objects.select_related('profile').get(pk=request.user.pk)
         user_form = UserSettingsForm(
             data=request.POST,
-            instance=request.user
+            instance=user
         )
         profile_form = ProfileSettingsForm(
             data=request.POST,
-            instance=request.user.profile,
-            user=request.user,
+            instance=user.profile,
+            user=user,
             FILES=request.FILES
         )
         if user_form.is_valid() and profile_form.is_valid():
             user = user_form.save()
             profile_form.save()
+            # The page is rendered with the saved names
+            request.user = user
 
     context = {
         'user_form': user_form,
@@ -136,7 +319,8 @@ def login(request):
                 else:
                     return redirect(reverse('home'))
 
-    if request.session.get('next') != next_url:
+    # Sessions without next are not written on every visit
+    if request.session.get('next', '') != next_url:
         request.session['next'] = next_url
 
     context = {
@@ -174,3 +358,20 @@ def register(request):
     else:
         form = RegistrationForm()
     return render(request, 'register.html', {'form': form})
+
+
+@staff_member_required
+def profiling_stats(request):
+    # Requests recorded by app.profiling in this worker, by view
+    return render(request, 'profiling.html', {
+        'enabled': profiling.enabled(),
+        'stats': profiling.stats(),
+    })
+
+
+@staff_member_required
+def profiling_export(request):
+    return JsonResponse({
+        'stats': profiling.stats(),
+        'requests': profiling.records(),
+    })
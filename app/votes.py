@@ -0,0 +1,173 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    # Per user rate limit: bucket of `capacity` tokens
+    # refilled with `rate` tokens per second
+
+    MAX_BUCKETS = 10000
+
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def consume(self, key, tokens=1):
+        now = time.monotonic()
+        with self.lock:
+            available, updated = self.buckets.get(key, (self.capacity, now))
+            available = min(self.capacity, available + (now - updated) * self.rate)
+            allowed = available >= tokens
+            if allowed:
+                available -= tokens
+            if len(self.buckets) >= self.MAX_BUCKETS:
+                self.prune(now)
+            self.buckets[key] = (available, now)
+        return allowed
+
+    def prune(self, now):
+        # Forget users whose buckets are already full again
+        self.buckets = {
+            key: (available, updated)
+            for key, (available, updated) in self.buckets.items()
+            if available + (now - updated) * self.rate < self.capacity
+        }
+
+
+class VoteBuffer:
+    # Write-behind buffer of likes and dislikes. Clicks only change the
+    # wanted state of the vote in memory; a flush writes each changed
+    # vote once, all in one transaction. Flush happens when the buffer
+    # holds `size` votes or `delay` seconds after the first one.
+    # Votes are kept by user and target, a vote row is not needed
+    # until the flush writes it
+
+    def __init__(self, size, delay):
+        self.size = size
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.timer = None
+        self.reset()
+
+    def reset(self):
+        # (vote model, target pk, user pk) -> {'initial': vote when the
+        # first click was buffered, 'final': wanted vote}
+        self.pending = {}
+        # (vote model, target pk) -> set of pending keys
+        self.targets = defaultdict(set)
+
+    def pending_vote(self, model, target_id, user_id):
+        # Wanted vote, None if the user has no buffered click on the target
+        with self.lock:
+            entry = self.pending.get((model, target_id, user_id))
+            return None if entry is None else entry['final']
+
+    def add(self, model, target_id, user_id, current, action):
+        # current is the vote in the database, it is used by the first
+        # click only. Returns wanted vote and not yet written change of
+        # target score
+        key = (model, target_id, user_id)
+        target_key = key[:2]
+        value = model.LIKE if action == 'like' else model.DISLIKE
+
+        with self.lock:
+            entry = self.pending.setdefault(key, {
+                'initial': current,
+                'final': current,
+            })
+            entry['final'] = model.UNVOTED if entry['final'] == value else value
+            self.targets[target_key].add(key)
+            pending_delta = sum(
+                self.pending[k]['final'] - self.pending[k]['initial']
+                for k in self.targets[target_key]
+            )
+            final = entry['final']
+            is_full = len(self.pending) >= self.size
+            if not is_full:
+                self.start_timer()
+
+        if is_full:
+            self.flush()
+        return final, pending_delta
+
+    def start_timer(self):
+        # Called with the lock held
+        if self.timer is None:
+            self.timer = threading.Timer(self.delay, self.flush_by_timer)
+            self.timer.daemon = True
+            self.timer.start()
+
+    def restore(self, pending):
+        # Votes of a failed flush go back for the next one. Clicks made
+        # since then are newer, their entries are kept
+        with self.lock:
+            for key, entry in pending.items():
+                if key not in self.pending:
+                    self.pending[key] = entry
+                    self.targets[key[:2]].add(key)
+            self.start_timer()
+
+    def pending_votes(self, model, user_id):
+        # {target pk: wanted vote} of not yet written votes of the user
+        with self.lock:
+            return {
+                target_id: entry['final']
+                for (vote_model, target_id, voter_id), entry in self.pending.items()
+                if vote_model is model and voter_id == user_id
+            }
+
+    def flush(self):
+        with self.lock:
+            pending = self.pending
+            self.reset()
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+        if not pending:
+            return 0
+
+        finals = defaultdict(dict)
+        for (model, target_id, user_id), entry in pending.items():
+            finals[model][target_id, user_id] = entry['final']
+
+        try:
+            with transaction.atomic():
+                # Previous votes come from the writes (VoteManager.record_many)
+                written = 0
+                for model, votes in finals.items():
+                    previous = model.objects.record_many(votes)
+                    written += sum(1 for key, vote in votes.items() if previous[key] != vote)
+                return written
+        except Exception:
+            logger.exception('Failed to write %d buffered votes, kept for the next flush', len(pending))
+            self.restore(pending)
+            return 0
+
+    def flush_by_timer(self):
+        try:
+            self.flush()
+        finally:
+            # Timer thread has its own connection
+            connection.close()
+
+
+vote_limiter = TokenBucket(
+    settings.VOTE_RATE_CAPACITY,
+    settings.VOTE_RATE_PER_SECOND
+)
+vote_buffer = VoteBuffer(
+    settings.VOTE_BUFFER_SIZE,
+    settings.VOTE_BUFFER_DELAY
+)
+# Votes still in memory are written on normal shutdown
+atexit.register(vote_buffer.flush)
@@ -5,6 +5,23 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
+
+ASGI mode serves the question lists (index, tag and answers pages) with
+async views from app/async_views.py. Their queries run at the same time
+in a thread pool and a worker is not blocked by slow clients, so one
+process handles many more connections than a WSGI worker:
+
+    pip install uvicorn
+    uvicorn askme.asgi:application --workers 4
+
+or under gunicorn:
+
+    gunicorn askme.asgi:application -k uvicorn.workers.UvicornWorker -w 4
+
+Concurrent queries run in a pool of DB_POOL_SIZE threads per worker,
+each with a persistent connection, so the database max_connections has
+to allow for workers x (DB_POOL_SIZE + 1). Static files collected by
+collectstatic are served by app.staticfiles.StaticFilesMiddleware.
 """
 
 import os
@@ -12,5 +29,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'askme.settings')
+os.environ.setdefault('ASKME_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,10 +45,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'app.staticfiles.StaticFilesMiddleware',
+    'app.profiling.ProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'app.user_cache.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -65,7 +68,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
-                'app.context_processors.all_tags_processor',
+                'app.context_processors.popular_tags_processor',
                 'app.context_processors.best_members_processsor',
             ],
         },
@@ -78,15 +81,126 @@ WSGI_APPLICATION = 'askme.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.1/ref/settings/#databases
 
+# Connections are kept for CONN_MAX_AGE seconds instead of a new
+# connect and MySQL handshake per request (0 closes them after every
+# request, None never). Every thread of a worker keeps one, see
+# DB_POOL_SIZE. Check overhead with `manage.py measure_db_connect`.
+# Measured on SQLite only: a request with one query takes 0.42 ms with
+# a new connection and 0.03 ms with a persistent one (with or without
+# health check). The MySQL handshake costs more and is not measured
+# yet, run the command against the production server before tuning
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.mysql',
         'OPTIONS': {
             'read_default_file': '/etc/mysql/my.cnf',
         },
+        'CONN_MAX_AGE': int(os.environ.get('ASKME_DB_CONN_MAX_AGE', 60)),
     }
 }
 
+# Persistent connections idle for this many seconds are pinged before
+# reuse and replaced if the server dropped them (app/db.py)
+DB_HEALTH_CHECK_INTERVAL = 10
+
+# Threads with their own connections running queries of async views
+# at the same time, per worker process. Total connections of the site:
+# workers x (server threads + DB_POOL_SIZE)
+DB_POOL_SIZE = int(os.environ.get('ASKME_DB_POOL_SIZE', 4))
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# Local memory is used unless another backend is set in environment,
+# e.g. ASKME_CACHE_BACKEND=django.core.cache.backends.memcached.PyMemcacheCache
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'ASKME_CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('ASKME_CACHE_LOCATION', 'askme'),
+    }
+}
+
+# Cache for sidebar tags and best members
+SIDEBAR_CACHE_ALIAS = 'default'
+SIDEBAR_CACHE_TIMEOUT = 60 * 5
+
+# Memcached or Redis is one cache for all worker processes. Local memory
+# is a cache per process, where a logout or a profile change made by one
+# worker is not seen by the others, so sessions and users are cached
+# only with a shared backend
+SHARED_CACHE = any(
+    name in CACHES['default']['BACKEND'].lower() for name in ('memcached', 'redis')
+)
+
+# With a shared cache sessions are read from it and written through to
+# the database, otherwise they are kept in the database only.
+# ASKME_SESSION_ENGINE=django.contrib.sessions.backends.signed_cookies
+# keeps them in a signed cookie instead, requests use no storage at all
+SESSION_ENGINE = os.environ.get(
+    'ASKME_SESSION_ENGINE',
+    'django.contrib.sessions.backends.cached_db' if SHARED_CACHE
+    else 'django.contrib.sessions.backends.db'
+)
+
+# The logged in user with profile is kept in the cache for
+# USER_CACHE_TIMEOUT seconds (app/user_cache.py), saves of the user or
+# the profile replace it. Off without a shared cache
+USER_CACHE_ENABLED = SHARED_CACHE
+USER_CACHE_TIMEOUT = 60 * 5
+
+# Hot questions: an answer counts as HOT_ANSWER_WEIGHT votes, and a
+# question needs 10 times more activity than one HOT_DECAY_SECONDS
+# younger. Run `manage.py recompute_hot_ranks` every few minutes
+HOT_ANSWER_WEIGHT = 2
+HOT_DECAY_SECONDS = 45000
+
+# Request profiling (app/profiling.py), off by default. Every worker
+# keeps its last PROFILING_BUFFER_SIZE requests, staff see them summed
+# up by view at /profiling/ and export them from /profiling/export/
+PROFILING = os.environ.get('ASKME_PROFILING') == '1'
+PROFILING_BUFFER_SIZE = 1000
+
+# Tag autocomplete answers with TAG_AUTOCOMPLETE_LIMIT most used of
+# the first TAG_AUTOCOMPLETE_SCAN tags with the prefix. Its in-memory
+# index is rebuilt on tag changes and every TAG_INDEX_MAX_AGE seconds
+TAG_AUTOCOMPLETE_LIMIT = 10
+TAG_AUTOCOMPLETE_SCAN = 200
+TAG_INDEX_MAX_AGE = 300
+
+# Related questions block of the answers page, picked among
+# RELATED_CANDIDATES questions sharing most tags
+RELATED_QUESTIONS_COUNT = 5
+RELATED_CANDIDATES = 20
+
+# Async list views (app/async_views.py), turned on by askme/asgi.py.
+# Under WSGI every async view would need its own event loop
+ASYNC_VIEWS = os.environ.get('ASKME_ASYNC_VIEWS') == '1'
+
+# Seconds anonymous pages of question lists are kept in the cache,
+# 0 turns the page cache off. Writes replace pages earlier, votes do not
+PAGE_CACHE_TIMEOUT = 30
+
+# Number of tags in "Popular Tags" block
+SIDEBAR_TAGS_COUNT = 20
+
+# Weight of one vote of question score in search ranking,
+# added to TF-IDF relevance of the question
+SEARCH_SCORE_WEIGHT = 0.05
+
+# Votes are written in batches of VOTE_BUFFER_SIZE votes or
+# VOTE_BUFFER_DELAY seconds after the first click, whichever is first
+VOTE_BUFFER_SIZE = 100
+VOTE_BUFFER_DELAY = 2
+
+# Every user can vote VOTE_RATE_CAPACITY times in a row,
+# then VOTE_RATE_PER_SECOND times per second
+VOTE_RATE_CAPACITY = 10
+VOTE_RATE_PER_SECOND = 1
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -126,6 +240,39 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# collectstatic target, served by app.staticfiles.StaticFilesMiddleware
+# when DEBUG is off
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+
+# Builds STATIC_BUNDLES, adds content hashes to file names and
+# pre-compresses them during collectstatic
+STATICFILES_STORAGE = 'app.staticfiles.BundleStorage'
+
+# Files loaded together are served as one, see {% bundle %}
+STATIC_BUNDLES = {
+    'css/base.bundle.css': [
+        'css/bootstrap.min.css',
+        'css/sidebar.css',
+        'css/footer.css',
+        'css/navbar.css',
+        'css/base.css',
+    ],
+    'css/questions.bundle.css': [
+        'css/question_list.css',
+        'css/score.css',
+    ],
+    'css/answers.bundle.css': [
+        'css/answers.css',
+        'css/score.css',
+    ],
+    'js/base.bundle.js': [
+        'js/jquery.slim.min.js',
+        'js/popper.min.js',
+        'js/bootstrap.min.js',
+        'js/votes.js',
+    ],
+}
+
 STATICFILES_DIRS = [
     BASE_DIR / "static",
 ]
@@ -135,6 +282,31 @@ MEDIA_URL = '/media/'
 
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Avatars are shown in cards as square thumbnails of this size,
+# made in AVATAR_THUMBNAIL_WORKERS threads (0 - during the request)
+AVATAR_THUMBNAIL_SIZE = 128
+AVATAR_THUMBNAIL_FORMAT = 'WEBP'
+AVATAR_THUMBNAIL_QUALITY = 80
+AVATAR_THUMBNAIL_WORKERS = 2
+
 #Custom URLs for auth
 LOGIN_URL = '/login/'
-LOGIN_REDIRECT_URL = '/login/'
\ No newline at end of file
+LOGIN_REDIRECT_URL = '/login/'
+
+
+# Performance budgets per url name, checked by app/test_budgets.py
+# queries - number of SQL queries, sql_ms - total time of them,
+# render_ms - template rendering with context processors. Measured with
+# a shared cache (cached sessions and users, see SHARED_CACHE)
+PERFORMANCE_BUDGETS = {
+    'hot': {'queries': 3, 'sql_ms': 50, 'render_ms': 250},
+    'home': {'queries': 3, 'sql_ms': 50, 'render_ms': 250},
+    'answers': {'queries': 5, 'sql_ms': 50, 'render_ms': 250},
+    'tag': {'queries': 6, 'sql_ms': 50, 'render_ms': 250},
+    'tags': {'queries': 3, 'sql_ms': 50, 'render_ms': 250},
+    'search': {'queries': 4, 'sql_ms': 50, 'render_ms': 250},
+    'ask': {'queries': 0, 'sql_ms': 50, 'render_ms': 250},
+    'settings': {'queries': 0, 'sql_ms': 50, 'render_ms': 250},
+    'login': {'queries': 0, 'sql_ms': 50, 'render_ms': 250},
+    'register': {'queries': 0, 'sql_ms': 50, 'render_ms': 250},
+}
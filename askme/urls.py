@@ -15,25 +15,35 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path
-from app import views
+from app import views, async_views
 
 from django.conf import settings
 from django.conf.urls.static import static
 
+# List pages are async when the site runs under ASGI
+list_views = async_views if settings.ASYNC_VIEWS else views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', views.index, name='home'),
+    path('', list_views.index, name='home'),
+    path('hot/', views.hot, name='hot'),
     path('ask/', views.ask_question, name='ask'),
-    path('question/<int:question_id>/', views.answers, name='answers'),
-    path('tag/<slug:tag>/', views.tag_questions, name='tag'),
+    path('question/<int:question_id>/', list_views.answers, name='answers'),
+    path('question/<int:question_id>/vote/', views.vote_question, name='vote_question'),
+    path('answer/<int:answer_id>/vote/', views.vote_answer, name='vote_answer'),
+    path('tag/<slug:tag>/', list_views.tag_questions, name='tag'),
+    path('tags/', views.tags, name='tags'),
+    path('tags/autocomplete/', views.tag_autocomplete, name='tag_autocomplete'),
+    path('search/', views.search, name='search'),
     path('settings/', views.settings, name='settings'),
     path('login/', views.login, name='login'),
     path('logout/', views.logout, name='logout'),
     path('register/', views.register, name='register'),
+    path('profiling/', views.profiling_stats, name='profiling'),
+    path('profiling/export/', views.profiling_export, name='profiling_export'),
 ]
 
+# Static files are served by app.staticfiles.StaticFilesMiddleware
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL,
                           document_root=settings.MEDIA_ROOT)
-else:
-    urlpatterns += staticfiles_urlpatterns()
@@ -0,0 +1,69 @@
+// Tag autocomplete of the ask form, the select only has chosen tags
+(function () {
+    var select = document.querySelector('select[data-autocomplete]');
+    if (!select) {
+        return;
+    }
+
+    var input = document.createElement('input');
+    input.type = 'text';
+    input.className = 'form-control mb-1';
+    input.placeholder = 'Find a tag';
+    input.setAttribute('autocomplete', 'off');
+    var list = document.createElement('div');
+    list.className = 'list-group mb-2';
+    select.parentNode.insertBefore(input, select);
+    select.parentNode.insertBefore(list, select);
+
+    function choose(tag) {
+        var option = select.querySelector('option[value="' + tag.id + '"]');
+        if (!option) {
+            option = new Option(tag.tag, tag.id);
+            select.appendChild(option);
+        }
+        option.selected = true;
+        input.value = '';
+        list.innerHTML = '';
+    }
+
+    function show(tags) {
+        list.innerHTML = '';
+        tags.forEach(function (tag) {
+            var item = document.createElement('button');
+            item.type = 'button';
+            item.className = 'list-group-item list-group-item-action py-1';
+            item.textContent = tag.tag + ' (' + tag.count + ')';
+            item.addEventListener('click', function () {
+                choose(tag);
+            });
+            list.appendChild(item);
+        });
+    }
+
+    var timer = null;
+    var last = '';
+    input.addEventListener('input', function () {
+        clearTimeout(timer);
+        // One request after the user stops typing
+        timer = setTimeout(function () {
+            var prefix = input.value.trim();
+            if (prefix === last) {
+                return;
+            }
+            last = prefix;
+            if (!prefix) {
+                show([]);
+                return;
+            }
+            fetch(select.dataset.autocomplete + '?q=' + encodeURIComponent(prefix), {
+                credentials: 'same-origin'
+            }).then(function (response) {
+                return response.json();
+            }).then(function (data) {
+                if (input.value.trim() === prefix) {
+                    show(data.tags);
+                }
+            });
+        }, 150);
+    });
+})();
@@ -0,0 +1,72 @@
+// Likes and dislikes of questions and answers without page reload
+(function () {
+    function getCookie(name) {
+        var match = document.cookie.match(new RegExp('(^|;\\s*)' + name + '=([^;]*)'));
+        return match ? decodeURIComponent(match[2]) : null;
+    }
+
+    function showVote(form, vote) {
+        form.dataset.vote = vote;
+        form.querySelectorAll('button[data-action]').forEach(function (button) {
+            var active = (button.dataset.action === 'like' && vote === 1) ||
+                (button.dataset.action === 'dislike' && vote === -1);
+            button.classList.toggle('active', active);
+        });
+    }
+
+    // Votes of the user for pages served from the page cache
+    function showUserVotes() {
+        var data = document.getElementById('user-votes');
+        if (!data) {
+            return;
+        }
+        var votes = JSON.parse(data.textContent);
+        document.querySelectorAll('form.js-vote[data-target]').forEach(function (form) {
+            if (form.dataset.target in votes) {
+                showVote(form, votes[form.dataset.target]);
+            }
+        });
+    }
+
+    function sendVote(form, action) {
+        var body = new URLSearchParams();
+        body.append('action', action);
+
+        fetch(form.action, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {
+                'X-CSRFToken': getCookie('csrftoken'),
+                'X-Requested-With': 'XMLHttpRequest'
+            },
+            body: body
+        }).then(function (response) {
+            return response.json().then(function (data) {
+                if (response.status === 401) {
+                    window.location = data.login_url + '?next=' + encodeURIComponent(window.location.pathname);
+                    return;
+                }
+                if (!response.ok) {
+                    alert(data.error);
+                    return;
+                }
+                var score = document.querySelector(form.dataset.score);
+                if (score) {
+                    score.textContent = data.score;
+                }
+                showVote(form, data.vote);
+            });
+        });
+    }
+
+    showUserVotes();
+
+    document.addEventListener('click', function (event) {
+        var button = event.target.closest('form.js-vote button[data-action]');
+        if (!button) {
+            return;
+        }
+        event.preventDefault();
+        sendVote(button.closest('form'), button.dataset.action);
+    });
+})();